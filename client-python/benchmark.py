@@ -0,0 +1,447 @@
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import platform
+import argparse
+import tempfile
+import types
+import threading
+import tracemalloc
+import subprocess
+import contextlib
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# Headless + a throwaway disk cache, before script.py reads its config
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+CACHE_TMP = tempfile.mkdtemp(prefix="bench-cache-")
+os.environ["CACHE_DIR"] = CACHE_TMP
+
+import numpy as np
+import pygame
+import script
+
+# --- 1. CONFIGURATION ---
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "benchmarks")
+WARMUP_FRAMES = 30
+REGRESSION_PCT = 10 # a metric this much worse than the baseline is flagged
+
+# Metrics compared against a baseline, and which direction is better
+COMPARED = {'fps': 'higher', 'alloc_kb': 'lower', 'ttp_ms': 'lower'}
+
+# --- 2. FIXTURES ---
+
+def story_ids(limit=None):
+    root = script.GENERATED_STORIES_DIR
+    ids = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    return ids[:limit] if limit else ids
+
+def load_stories(limit):
+    return [script.load_local_story(script.resolve_story_path(sid)) for sid in story_ids(limit)]
+
+class StubServer:
+    """
+    Stand-in for the story server: /story hands out `story_id`'s JSON with
+    audioUrls pointing at /stories/<id>/<n>.wav, served from the generated
+    stories folder after `latency` seconds. /story/bundle and /story/stream
+    serve the same story in the server's bundle and NDJSON formats (every
+    line ready at once, with its WAV after it on ?clips=1). Counts requests
+    per kind.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.story_id = None
+        self.requests = {'story': 0, 'audio': 0}
+        stub = self
+        root = script.GENERATED_STORIES_DIR
+
+        def story_json(sid):
+            with open(os.path.join(root, sid, f"{sid}.json"), encoding='utf-8') as f:
+                data = json.load(f)
+            for i, line in enumerate(data['dialogue']):
+                line['audioUrl'] = f"/stories/{sid}/{i}.wav"
+            return data
+
+        def etag(path):
+            st = os.stat(path)
+            return f'W/"{st.st_size:x}-{int(st.st_mtime * 1000):x}"'
+
+        def bundle(sid):
+            data = story_json(sid)
+            audio, blobs, offset = [], [], 0
+            for i in range(len(data['dialogue'])):
+                path = os.path.join(root, sid, f"{i}.wav")
+                if not os.path.isfile(path):
+                    audio.append(None)
+                    continue
+                size = os.path.getsize(path)
+                audio.append({'offset': offset, 'length': size, 'etag': etag(path)})
+                blobs.append(path)
+                offset += size
+            manifest = json.dumps({'story': data, 'audio': audio}).encode()
+            return struct.pack('>I', len(manifest)) + manifest, blobs, offset
+
+        def stream_events(sid, clips):
+            """(event, WAV bytes sent after it or b"")"""
+            data = story_json(sid)
+            dialogue = data.pop('dialogue')
+            yield {'type': 'story', 'original': data['original'], 'content': data.get('content', ''), 'lines': len(dialogue)}, b""
+            for i, line in enumerate(dialogue):
+                event = {'type': 'line', 'index': i, 'line': line}
+                if not clips:
+                    yield event, b""
+                    continue
+                path = os.path.join(root, sid, f"{i}.wav")
+                clip = b""
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        clip = f.read()
+                audio = {'length': len(clip), 'etag': etag(path)} if clip else None
+                yield {**event, 'audio': audio}, clip
+            yield {'type': 'end'}, b""
+
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # chunked NDJSON, like the node server
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=root, **kwargs)
+
+            def do_GET(self):
+                time.sleep(stub.latency)
+                url = urlsplit(self.path)
+                if url.path == '/story/stream':
+                    stub.requests['story'] += 1
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    clips = parse_qs(url.query).get('clips') == ['1']
+                    for event, clip in stream_events(stub.story_id, clips):
+                        chunk = (json.dumps(event) + "\n").encode() + clip
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                if self.path == '/story/bundle':
+                    stub.requests['story'] += 1
+                    head, blobs, size = bundle(stub.story_id)
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/vnd.story-bundle')
+                    self.send_header('Content-Length', str(len(head) + size))
+                    self.end_headers()
+                    try:
+                        self.wfile.write(head)
+                        for path in blobs:
+                            with open(path, 'rb') as f:
+                                shutil.copyfileobj(f, self.wfile)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass # client had the rest cached
+                    return
+                if self.path.startswith('/story') and not self.path.startswith('/stories/'):
+                    stub.requests['story'] += 1
+                    body = json.dumps(story_json(stub.story_id)).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                stub.requests['audio'] += 1
+                self.path = self.path[len('/stories'):]
+                return super().do_GET()
+
+            def log_message(self, *args): pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+# --- 3. BENCHMARKS ---
+# Each frame benchmark is a setup function returning a step() callable that
+# renders one frame's worth of that path.
+
+def text_rect():
+    """The dialogue text area of SceneRenderer's 1080p layout."""
+    panel_w, panel_h = script.WIDTH * 0.8, script.HEIGHT * 0.5
+    panel_x, panel_y = (script.WIDTH - panel_w) // 2, (script.HEIGHT - panel_h) // 2
+    return pygame.Rect(panel_x + 30, panel_y + 80, panel_w - 60, panel_h - 100)
+
+class EngineDriver:
+    """Plays the fixture stories back to back on OfflineEngine's virtual clock."""
+    def __init__(self, stories):
+        self.stories = stories
+        self.next_story = 0
+        self.frame_ms = 1000 / script.FPS
+        self._load()
+
+    def _load(self):
+        payload = self.stories[self.next_story % len(self.stories)]
+        self.next_story += 1
+        self.engine = script.OfflineEngine(payload)
+
+    def step(self):
+        engine = self.engine
+        engine.clock_ms += self.frame_ms
+        engine.update(self.frame_ms)
+        engine.channel.read_frame()
+        if engine.state == script.State.WAITING:
+            self._load()
+        return engine
+
+def bench_engine(ctx):
+    driver = EngineDriver(ctx['stories'])
+    return driver.step
+
+def bench_scene(ctx):
+    driver = EngineDriver(ctx['stories'])
+    scene = script.SceneRenderer(ctx['screen'], *ctx['fonts'])
+    stars = script.StarField()
+    return lambda: scene.draw(driver.step(), stars)
+
+def bench_line_change(ctx):
+    """A new dialogue line every frame (speakers alternate, so the scene rebuilds its layers each time)."""
+    lines = [(data, i) for data, _ in ctx['stories'] for i in range(len(data['dialogue']))]
+    engine = types.SimpleNamespace(state=script.State.PLAYING, display_text="")
+    scene = script.SceneRenderer(ctx['screen'], *ctx['fonts'])
+    stars = script.StarField()
+    state = {'line': 0}
+    def step():
+        engine.story_data, engine.current_index = lines[state['line'] % len(lines)]
+        engine.full_text = engine.story_data['dialogue'][engine.current_index]['text']
+        state['line'] += 1
+        scene.draw(engine, stars)
+    return step
+
+def bench_text(ctx):
+    """Typewriter reveal of every dialogue line, one character per frame."""
+    screen, font = ctx['screen'], ctx['fonts'][0]
+    rect = text_rect()
+    lines = [l['text'] for data, _ in ctx['stories'] for l in data['dialogue'] if l.get('text')]
+    state = {'line': 0, 'chars': 0}
+    def step():
+        text = lines[state['line'] % len(lines)]
+        state['chars'] += 1
+        if state['chars'] > len(text):
+            state['line'] += 1
+            state['chars'] = 0
+        screen.fill(script.COLOR_PANEL, rect)
+        script.draw_wrapped_text(screen, text[:state['chars']], font, script.COLOR_TEXT_MAIN, rect, text, script.COLOR_PANEL)
+    return step
+
+def bench_starfield(ctx, count=None):
+    stars = script.StarField(count or script.STAR_COUNT)
+    def step():
+        stars.update()
+        stars.pixels()
+    return step
+
+def bench_export(ctx, fmt):
+    scene = script.SceneRenderer(ctx['screen'], *ctx['fonts'])
+    scene.draw(EngineDriver(ctx['stories']).step(), script.StarField())
+    exporter = script.FrameExporter(ctx['screen'], fmt)
+    out = memoryview(bytearray(exporter.frame_size)) # what FrameWriter hands it
+    return lambda: exporter.export_into(out)
+
+def bench_idle(ctx, static):
+    """Between two stories (WAITING): the scene plus a native export, skipped when nothing changed."""
+    engine = script.OfflineEngine(ctx['stories'][0])
+    frame_ms = 1000 / script.FPS
+    while engine.state != script.State.WAITING:
+        engine.clock_ms += frame_ms
+        engine.update(frame_ms)
+    scene = script.SceneRenderer(ctx['screen'], *ctx['fonts'], static=static)
+    stars = script.StarField()
+    exporter = script.FrameExporter(ctx['screen'])
+    out = memoryview(bytearray(exporter.frame_size))
+    def step():
+        if scene.draw(engine, stars): exporter.export_into(out)
+    return step
+
+FRAME_BENCHES = {
+    'engine': bench_engine,
+    'scene': bench_scene,
+    'line_change': bench_line_change,
+    'text': bench_text,
+    'starfield': bench_starfield,
+    'starfield_3000': lambda ctx: bench_starfield(ctx, 3000),
+    'export_native': lambda ctx: bench_export(ctx, 'native'),
+    'export_rgb24': lambda ctx: bench_export(ctx, 'rgb24'),
+    'export_yuv420p': lambda ctx: bench_export(ctx, 'yuv420p'),
+    'idle': lambda ctx: bench_idle(ctx, False),
+    'idle_static': lambda ctx: bench_idle(ctx, True),
+}
+
+def run_frames(setup, ctx, frames):
+    """Times `frames` steps, then repeats them under tracemalloc for allocations."""
+    step = setup(ctx)
+    for _ in range(WARMUP_FRAMES): step()
+    times = np.empty(frames)
+    for i in range(frames):
+        t = time.perf_counter()
+        step()
+        times[i] = time.perf_counter() - t
+
+    # Peak Python/NumPy allocation within a frame (SDL's own memory isn't traced)
+    tracemalloc.start()
+    peaks = np.empty(min(frames, 300))
+    start, _ = tracemalloc.get_traced_memory()
+    for i in range(len(peaks)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        step()
+        peaks[i] = tracemalloc.get_traced_memory()[1] - before
+    retained = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    ms = times * 1000
+    return {
+        'frames': frames,
+        'fps': round(frames / times.sum(), 1),
+        'ms_p50': round(float(np.percentile(ms, 50)), 3),
+        'ms_p95': round(float(np.percentile(ms, 95)), 3),
+        'ms_max': round(float(ms.max()), 3),
+        'alloc_kb': round(float(peaks.mean()) / 1024, 2),
+        'retained_kb': round(retained / 1024, 2),
+    }
+
+def run_fetch(ctx, latency, rounds):
+    """
+    Time-to-playable of BroadcastEngine._fetch_logic: until it returns a
+    story that can start (a streamed story after its first line, otherwise
+    with every clip downloaded). 'requests' counts everything the story
+    took. 'cold' starts from an empty disk cache, 'warm' fetches the same
+    story again and should not download any WAVs.
+    """
+    stub = StubServer(latency)
+    script.API_BASE = stub.base
+    script.API_URL = f"{stub.base}{script.ENDPOINT}"
+    script.BUNDLE_URL = f"{stub.base}{script.BUNDLE_ENDPOINT}"
+    script.STREAM_URL = f"{stub.base}{script.STREAM_ENDPOINT}"
+    results = {}
+    try:
+        for mode in ('cold', 'warm'):
+            times, requests = [], []
+            for sid in story_ids(rounds):
+                stub.story_id = sid
+                if mode == 'cold':
+                    shutil.rmtree(CACHE_TMP, ignore_errors=True)
+                engine = script.BroadcastEngine()
+                with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+                    if mode == 'warm': engine._fetch_logic()[1].complete.wait() # populate the cache
+                    before = sum(stub.requests.values())
+                    t = time.perf_counter()
+                    _, clips = engine._fetch_logic()
+                    times.append(time.perf_counter() - t)
+                    clips.complete.wait() # the rest of a streamed story
+                requests.append(sum(stub.requests.values()) - before)
+                engine.audio_pool.shutdown()
+                engine.http.close()
+            ms = np.array(times) * 1000
+            results[f'fetch_{mode}'] = {
+                'stories': len(times),
+                'latency_ms': round(latency * 1000),
+                'ttp_ms': round(float(np.percentile(ms, 50)), 1),
+                'ttp_ms_max': round(float(ms.max()), 1),
+                'requests': round(float(np.mean(requests)), 1),
+            }
+    finally:
+        stub.close()
+    return results
+
+# --- 4. REPORTING ---
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'resolution': f"{script.WIDTH}x{script.HEIGHT}",
+    }
+
+def compare(results, baseline, threshold=REGRESSION_PCT):
+    """Prints each compared metric next to the baseline; returns the regressions."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base: continue
+        for key, better in COMPARED.items():
+            if key not in metrics or not base.get(key): continue
+            change = (metrics[key] - base[key]) / base[key] * 100
+            worse = -change if better == 'higher' else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            print(f"  {name:<16} {key:<9} {base[key]:>10} -> {metrics[key]:>10} ({change:+.1f}%){flag}")
+            if flag: regressions.append((name, key, round(change, 1)))
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the client render and fetch paths")
+    parser.add_argument('--only', default=None,
+                        help=f"comma separated subset of: {', '.join(list(FRAME_BENCHES) + ['fetch'])}")
+    parser.add_argument('--frames', type=int, default=600, help="measured frames per benchmark (default: 600)")
+    parser.add_argument('--stories', type=int, default=5, help="fixture stories to use (default: 5)")
+    parser.add_argument('--latency', type=float, default=50, help="stub server latency in ms (default: 50)")
+    parser.add_argument('--save', default=None, help="results file (default: benchmarks/<time>.json)")
+    parser.add_argument('--baseline', default=None, help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_PCT,
+                        help=f"percent change flagged as a regression (default: {REGRESSION_PCT})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    only = set(args.only.split(',')) if args.only else None
+    script._init_headless()
+    screen = pygame.display.get_surface()
+    ctx = {'screen': screen, 'fonts': script.load_fonts(), 'stories': load_stories(args.stories)}
+
+    results = {}
+    for name, setup in FRAME_BENCHES.items():
+        if only and name not in only: continue
+        results[name] = r = run_frames(setup, ctx, args.frames)
+        print(f"[BENCH] {name:<16} {r['fps']:>9.1f} fps  p50 {r['ms_p50']:.3f} ms  p95 {r['ms_p95']:.3f} ms  "
+              f"alloc {r['alloc_kb']:.1f} KB/frame")
+    if not only or 'fetch' in only:
+        for name, r in run_fetch(ctx, args.latency / 1000, args.stories).items():
+            results[name] = r
+            print(f"[BENCH] {name:<16} {r['ttp_ms']:>9.1f} ms to playable  ({r['requests']} requests, "
+                  f"{r['latency_ms']} ms latency)")
+
+    report = {'meta': metadata(), 'args': vars(args), 'results': results}
+    path = args.save or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[*] Results saved to {path}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"[*] Compared with {args.baseline} ({baseline.get('meta', {}).get('commit')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[!] {len(regressions)} regression(s) over {args.threshold}%")
+
+    shutil.rmtree(CACHE_TMP, ignore_errors=True)
+    pygame.quit()
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
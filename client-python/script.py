@@ -1,13 +1,28 @@
 import os
 import io
 import sys
+import json
+import hashlib
 import time
-import random
 import threading
+import bisect
 import requests
+from requests.adapters import HTTPAdapter
 import pygame
+import numpy as np
 import subprocess
-import platform
+import socket
+import wave
+import struct
+import argparse
+import queue
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from dotenv import load_dotenv
 
 # --- 1. CONFIGURATION ---
@@ -19,11 +34,168 @@ API_BASE = "http://localhost:4000"
 ENDPOINT = "/story"
 API_URL = f"{API_BASE}{ENDPOINT}"
 
+# STORY BUNDLE: the story and all of its WAVs in one streamed response.
+# Clips the disk cache already holds with the same ETag are skipped, and the
+# download stops early once everything left is cached. Servers without the
+# endpoint fall back to /story plus one request per clip.
+STORY_BUNDLE = os.getenv("STORY_BUNDLE", "1") == "1"
+BUNDLE_ENDPOINT = "/story/bundle"
+BUNDLE_URL = f"{API_BASE}{BUNDLE_ENDPOINT}"
+
+# STORY STREAM: STREAM_ENDPOINT (NDJSON) sends a story's lines as soon as the
+# server has their audio, so playback starts with the first line while later
+# ones are still being voiced (holding on the last line if it catches up).
+# Each line's WAV follows it in the same response, so a story is one request
+# like a bundle; a server that only sends the lines has the clips downloaded
+# alongside, AUDIO_FETCH_WORKERS at a time.
+# Tried before the bundle; servers without it fall back to that.
+STORY_STREAM = os.getenv("STORY_STREAM", "1") == "1"
+STREAM_ENDPOINT = "/story/stream"
+STREAM_URL = f"{API_BASE}{STREAM_ENDPOINT}"
+STREAM_READ_TIMEOUT = 120 # seconds without a new line before the rest is given up
+
 # RESOLUTION: 
 # Since we are piping raw data, we can use 1080p on Windows without issues.
 WIDTH, HEIGHT = 1920, 1080
 FPS = 30 
 
+# OUTPUT PROFILES:
+# One render loop feeds every profile listed in OUTPUTS. A profile names the
+# layout it shows, its encoded size/bitrate and where it goes ({key} is read
+# from the profile's stream key variable). Each layout is drawn once per
+# frame; every profile gets its own FFmpeg process (scaled as needed), so an
+# ingest that fails or restarts doesn't take the other outputs down.
+OUTPUTS = [o.strip() for o in os.getenv("OUTPUTS", "landscape").split(",") if o.strip()]
+LAYOUTS = {'landscape': (WIDTH, HEIGHT), 'vertical': (HEIGHT, WIDTH)}
+OUTPUT_PROFILES = {
+    'landscape': {'layout': 'landscape', 'size': (1920, 1080), 'bitrate': ('4500k', '5000k', '10000k'),
+                  'key': 'YOUTUBE_STREAM_KEY', 'url': 'rtmp://a.rtmp.youtube.com/live2/{key}'},
+    'vertical':  {'layout': 'vertical', 'size': (1080, 1920), 'bitrate': ('4500k', '5000k', '10000k'),
+                  'key': 'YOUTUBE_VERTICAL_STREAM_KEY', 'url': 'rtmp://a.rtmp.youtube.com/live2/{key}'},
+    # Low bitrate copy of the main stream to YouTube's backup ingest
+    'backup':    {'layout': 'landscape', 'size': (1280, 720), 'bitrate': ('1500k', '1800k', '3000k'),
+                  'key': 'YOUTUBE_STREAM_KEY', 'url': 'rtmp://b.rtmp.youtube.com/live2?backup=1/{key}'},
+}
+
+# PREFETCH:
+# How many stories are downloaded ahead of the one on screen, and how much
+# audio (WAV bytes plus the first decoded clips) the queue may hold before it pauses.
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 2))
+PREFETCH_MAX_MB = int(os.getenv("PREFETCH_MAX_MB", 256))
+FETCH_RETRY_DELAY = 5 # seconds
+
+# Dialogue WAVs are downloaded concurrently over one keep-alive pool.
+AUDIO_FETCH_WORKERS = int(os.getenv("AUDIO_FETCH_WORKERS", 8))
+
+# DISK CACHE:
+# The server rotates through the same stories, so JSON + WAVs are kept
+# on disk (survives restarts) and evicted least-recently-used over budget.
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", 1024))
+
+# AUDIO CLIP POOL: a story keeps its clips as downloaded WAV bytes and
+# decodes (converting to the mixer format) only AUDIO_DECODE_AHEAD lines
+# ahead of the one playing, within AUDIO_POOL_MB of decoded PCM per story.
+# Played clips are released.
+AUDIO_DECODE_AHEAD = int(os.getenv("AUDIO_DECODE_AHEAD", 2))
+AUDIO_POOL_MB = int(os.getenv("AUDIO_POOL_MB", 64))
+
+# DIALOGUE TIMING: each story is laid out as a timeline when it starts.
+# A line's text is typed out over its clip's duration; lines without a
+# clip type at CHAR_INTERVAL_MS per character and then hold SILENT_LINE_MS.
+LINE_GAP_MS = 300
+CHAR_INTERVAL_MS = 30
+SILENT_LINE_MS = 2000
+
+# AUDIO: the client mixes the dialogue itself and pipes PCM to FFmpeg next to
+# the video, one video frame's worth of samples per frame (no sound server).
+AUDIO_RATE = 44100
+AUDIO_CHANNELS = 2
+AUDIO_MONITOR = os.getenv("AUDIO_MONITOR", "1") == "1" # also play locally
+
+# FRAME EXPORT (pixel format piped to FFmpeg):
+# 'native'  - the screen's own buffer is written as-is (usually bgr0), no copy
+# 'rgb24'   - packed RGB converted into a reused buffer
+# 'yuv420p' - converted on the client; half the pipe bandwidth of rgb24
+FRAME_FORMAT = os.getenv("FRAME_FORMAT", "native")
+
+# FRAME WRITER:
+# Rendered frames go into a ring of FRAME_QUEUE_SIZE pre-allocated slots that
+# a dedicated thread drains into FFmpeg. FRAME_DROP_POLICY when it falls behind:
+# 'drop'      - the new frame is discarded
+# 'duplicate' - like 'drop', and the writer repeats the last frame whenever
+#               rendering lags, so FFmpeg keeps receiving FPS frames per second
+# 'block'     - the render loop waits for a free slot (nothing is lost)
+FRAME_QUEUE_SIZE = int(os.getenv("FRAME_QUEUE_SIZE", 8))
+FRAME_DROP_POLICY = os.getenv("FRAME_DROP_POLICY", "drop")
+
+# MULTI-PROCESS: spreads the client over three processes instead of one GIL.
+# This one runs the engine and draws, exporting frames into a shared memory
+# ring per layout; an output process feeds the rings (and the PCM) to
+# FFmpeg; a loader process fetches stories and decodes their audio, handing
+# over the decoded clips a decode-ahead window at a time (within AUDIO_POOL_MB).
+MULTIPROCESS = os.getenv("MULTIPROCESS", "0") == "1"
+
+# Background particles. Drawn vectorised, so thousands cost about the same as 80.
+STAR_COUNT = int(os.getenv("STAR_COUNT", 80))
+
+# IDLE FRAMES: a frame in which nothing on screen changed isn't exported
+# again, the writer resends the previous one. With STATIC_IDLE the stars
+# also hold still while nothing else moves (WAITING, ERROR, and a line
+# whose text is fully typed out), so those stretches cost next to nothing.
+STATIC_IDLE = os.getenv("STATIC_IDLE", "0") == "1"
+
+# METRICS:
+# Per-stage frame timings (p50/p95/p99 over the last METRICS_WINDOW frames)
+# and FFmpeg's -progress counters are logged as one JSON line every
+# METRICS_INTERVAL seconds, and served on http://127.0.0.1:METRICS_PORT/metrics
+# if a port is set. Encode speed under METRICS_MIN_SPEED logs a warning.
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", 10))
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 900))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_MIN_SPEED = float(os.getenv("METRICS_MIN_SPEED", 1.0))
+
+# ADAPTIVE ENCODER:
+# Each output's real-time encode speed (progress deltas, not FFmpeg's
+# running average) is judged over ENCODER_WINDOW seconds. Below
+# ENCODER_DOWN_SPEED it steps one level down ENCODER_LADDER: faster preset
+# first, then smaller frames, then fewer fps. After ENCODER_UP_AFTER healthy
+# seconds it tries one level up; a step up that doesn't hold doubles the
+# wait before the next try. Each step restarts that output's FFmpeg.
+ADAPTIVE_ENCODER = os.getenv("ADAPTIVE_ENCODER", "1") == "1"
+ENCODER_LADDER = [
+    {'preset': 'veryfast',  'scale': 1.0,  'fps': FPS},
+    {'preset': 'superfast', 'scale': 1.0,  'fps': FPS},
+    {'preset': 'ultrafast', 'scale': 1.0,  'fps': FPS},
+    {'preset': 'ultrafast', 'scale': 0.75, 'fps': FPS},
+    {'preset': 'ultrafast', 'scale': 0.5,  'fps': FPS},
+    {'preset': 'ultrafast', 'scale': 0.5,  'fps': FPS // 2},
+]
+ENCODER_DOWN_SPEED = float(os.getenv("ENCODER_DOWN_SPEED", 0.97))
+ENCODER_WINDOW = 10   # seconds of progress per decision
+ENCODER_SETTLE = 10   # seconds ignored after FFmpeg (re)starts
+ENCODER_UP_AFTER = int(os.getenv("ENCODER_UP_AFTER", 120))
+
+# ENCODER SUPERVISOR:
+# An output whose FFmpeg exits, breaks its pipe or reports no progress for
+# ENCODER_STALL_TIMEOUT seconds is restarted while rendering carries on:
+# right away the first time, then after a backoff doubling from
+# ENCODER_RETRY_DELAY up to ENCODER_RETRY_MAX seconds for as long as
+# restarts don't last ENCODER_RETRY_RESET seconds. The last
+# ENCODER_BACKLOG_SECONDS of frames rendered in the meantime are held (oldest
+# dropped first) and sent once FFmpeg is back. That is memory for
+# seconds * FPS raw frames per output while it is down: about 500 MB for 2 s
+# of 1080p bgr0 at 30 fps. The default covers a restart plus the first backoff.
+ENCODER_STALL_TIMEOUT = float(os.getenv("ENCODER_STALL_TIMEOUT", 15))
+ENCODER_RETRY_DELAY = 0.5
+ENCODER_RETRY_MAX = 30
+ENCODER_RETRY_RESET = 30
+ENCODER_BACKLOG_SECONDS = float(os.getenv("ENCODER_BACKLOG_SECONDS", 2))
+
+# OFFLINE RENDER (--render): stories are read from the server's output folder
+GENERATED_STORIES_DIR = os.getenv("GENERATED_STORIES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server", "public", "generated-stories"))
+RENDER_TAIL_MS = 1000 # keep rendering this long after the last line
+
 # Colors
 COLOR_BG = (10, 10, 14)
 COLOR_PANEL = (22, 22, 28)
@@ -42,246 +214,2357 @@ class State:
     WAITING = "WAITING"
     ERROR = "ERROR"
 
-class BroadcastEngine:
+def sound_nbytes(sound):
+    """Approximate decoded size of a pygame Sound (mixer format)."""
+    if not sound: return 0
+    freq, size, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * freq * channels * (abs(size) // 8))
+
+def wav_duration(blob):
+    """Length in seconds from a WAV header, without decoding (None if it isn't a readable WAV)."""
+    try:
+        with wave.open(io.BytesIO(blob)) as w:
+            return w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+class AudioClipPool:
+    """
+    The dialogue audio of one story, held as the bytes it was downloaded as.
+    Clips are decoded into mixer Sounds (resampled to the mixer format once,
+    there) only for the line playing and up to `ahead` lines after it, as
+    long as the decoded PCM fits `max_bytes`; earlier lines are released.
+    Decoding ahead happens on a background thread. Thread safe.
+    """
+    _decoder = None # one decode thread shared by every pool
+
+    def __init__(self, blobs, ahead=AUDIO_DECODE_AHEAD, max_bytes=AUDIO_POOL_MB * 1024 * 1024, complete=True):
+        self.blobs = list(blobs)
+        self.ahead = ahead
+        self.max_bytes = max_bytes
+        self.decoded = {} # index -> Sound
+        self.pending = set()
+        self.lock = threading.Lock()
+        # Line lengths up front for the timeline
+        self.durations = [self._duration(blob) for blob in self.blobs]
+        # Cleared while a streamed story is still receiving clips (see append)
+        self.complete = threading.Event()
+        if complete: self.complete.set()
+
+    def __len__(self):
+        return len(self.blobs)
+
+    @staticmethod
+    def _decode(blob):
+        return pygame.mixer.Sound(io.BytesIO(blob))
+
+    def _decode_line(self, index):
+        return self._decode(self.blobs[index])
+
+    @classmethod
+    def _duration(cls, blob):
+        """Clip length in seconds; only non-WAV clips are decoded for it."""
+        if not blob: return None
+        length = wav_duration(blob)
+        return length if length is not None else cls._decode(blob).get_length()
+
+    def append(self, blob):
+        """Adds the next line's clip (None without audio) to a growing pool."""
+        length = self._duration(blob)
+        with self.lock:
+            self.blobs.append(blob)
+            self.durations.append(length)
+
+    def _pcm_bytes(self, index):
+        freq, size, channels = pygame.mixer.get_init()
+        return int((self.durations[index] or 0) * freq * channels * (abs(size) // 8))
+
+    def decoded_bytes(self):
+        return sum(sound_nbytes(s) for s in list(self.decoded.values()))
+
+    def nbytes(self):
+        """Memory held: the encoded clips plus whatever is decoded."""
+        return sum(len(b) for b in self.blobs if b) + self.decoded_bytes()
+
+    def _window(self, index):
+        """Lines from `index` on that should be decoded, within the budget (the line itself always is)."""
+        budget = self.max_bytes
+        window = []
+        for i in range(index, min(index + 1 + self.ahead, len(self.blobs))):
+            if not self.blobs[i]: continue
+            budget -= self._pcm_bytes(i)
+            if window and budget < 0: break
+            window.append(i)
+        return window
+
+    def preload(self, index=0):
+        """Decodes the window starting at `index` on the calling thread."""
+        for i in self._window(index):
+            self._load(i)
+
+    def _load(self, i):
+        with self.lock:
+            if i in self.decoded: return self.decoded[i]
+        sound = self._decode_line(i)
+        with self.lock:
+            self.pending.discard(i)
+            return self.decoded.setdefault(i, sound)
+
+    def get(self, index):
+        """The Sound for line `index` (None without audio). Releases earlier lines and decodes ahead."""
+        if index >= len(self.blobs) or not self.blobs[index]: sound = None
+        else: sound = self._load(index)
+        window = self._window(index)
+        with self.lock:
+            for i in [i for i in self.decoded if i < index or (i != index and i not in window)]:
+                del self.decoded[i]
+            todo = [i for i in window if i not in self.decoded and i not in self.pending]
+            self.pending.update(todo)
+        if todo:
+            if AudioClipPool._decoder is None:
+                AudioClipPool._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode")
+            for i in todo:
+                AudioClipPool._decoder.submit(self._load, i)
+        return sound
+
+    def release(self):
+        with self.lock:
+            self.decoded.clear()
+
+class LoaderClipPool(AudioClipPool):
+    """
+    AudioClipPool of a story held by the loader process (MULTIPROCESS): the
+    clips stay there, only their lengths come here. Decoding a line asks
+    the loader for its mixer PCM, so the loader does the decoding and this
+    side only ever holds the decode-ahead window, within `max_bytes` as usual.
+    """
+    def __init__(self, loader, story_id):
+        super().__init__([], complete=False)
+        self.loader = loader
+        self.story_id = story_id
+
+    def append(self, duration):
+        """Adds the next line by its clip length (None without audio)."""
+        with self.lock:
+            self.blobs.append(duration is not None) # stands in for the clip the loader holds
+            self.durations.append(duration)
+
+    def _decode_line(self, index):
+        pcm = self.loader.pcm(self.story_id, index)
+        # A clip the loader lost plays as a moment of silence
+        return pygame.mixer.Sound(buffer=pcm or bytes(4))
+
+    def nbytes(self):
+        return self.decoded_bytes()
+
+    def release(self):
+        super().release()
+        self.loader.requests.put(('release', self.story_id))
+
+class DiskCache:
+    """
+    Content-addressed cache: blobs are stored under their sha256 and
+    index.json maps keys (URL paths, story ids) to a blob plus the
+    ETag/Last-Modified it was served with. Thread safe.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024):
+        self.dir = directory
+        self.blob_dir = os.path.join(directory, "blobs")
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.dirty = False
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.entries = self._load_index()
+        self._sweep_orphans()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _sweep_orphans(self):
+        # Blobs written before a crash but never indexed
+        known = {e['blob'] for e in self.entries.values()}
+        for name in os.listdir(self.blob_dir):
+            if name not in known:
+                try: os.remove(os.path.join(self.blob_dir, name))
+                except OSError: pass
+
+    def _blob_sizes(self):
+        return {e['blob']: e['size'] for e in self.entries.values()}
+
+    def get(self, key):
+        """Returns (content, entry) for a cached key, or (None, None)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry: return None, None
+            entry['atime'] = time.time()
+            self.dirty = True
+        try:
+            with open(os.path.join(self.blob_dir, entry['blob']), 'rb') as f:
+                return f.read(), entry
+        except OSError:
+            with self.lock:
+                self.entries.pop(key, None)
+            return None, None
+
+    def put(self, key, content, etag=None, last_modified=None):
+        blob = hashlib.sha256(content).hexdigest()
+        path = os.path.join(self.blob_dir, blob)
+        if not os.path.exists(path):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+        with self.lock:
+            self.entries[key] = {
+                'blob': blob, 'size': len(content),
+                'etag': etag, 'last_modified': last_modified,
+                'atime': time.time(),
+            }
+            self.dirty = True
+            self._evict()
+
+    def _evict(self):
+        sizes = self._blob_sizes()
+        total = sum(sizes.values())
+        if total <= self.max_bytes: return
+        for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]['atime']):
+            if total <= self.max_bytes: break
+            del self.entries[key]
+            blob = entry['blob']
+            if any(e['blob'] == blob for e in self.entries.values()):
+                continue
+            total -= sizes[blob]
+            try: os.remove(os.path.join(self.blob_dir, blob))
+            except OSError: pass
+
+    def flush(self):
+        """Persists the index (atomic replace). Called once per story."""
+        with self.lock:
+            if not self.dirty: return
+            snapshot = json.dumps(self.entries)
+            self.dirty = False
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(tmp, self.index_path)
+
+class BundleReader:
+    """
+    Reads a story bundle front to back as it arrives: a big-endian u32
+    manifest length, the manifest JSON ({story, audio}) and the clips back
+    to back. audio[i] is {offset, length, etag} (offset counted from the
+    end of the manifest) or None. Clips must be read in order; skipping
+    one discards its bytes.
+    """
+    CHUNK = 1 << 20
+
+    def __init__(self, stream):
+        self.stream = stream
+        (size,) = struct.unpack('>I', self._read(4))
+        self.manifest = json.loads(self._read(size))
+        self.pos = 0
+
+    def _read(self, n):
+        parts = []
+        while n > 0:
+            chunk = self.stream.read(min(n, self.CHUNK))
+            if not chunk: raise Exception("Bundle ended early")
+            parts.append(chunk)
+            n -= len(chunk)
+        return b"".join(parts)
+
+    def clip(self, entry):
+        """Bytes of one manifest audio entry."""
+        skip = entry['offset'] - self.pos
+        if skip < 0: raise ValueError("Bundle clips must be read in order")
+        while skip > 0:
+            skip -= len(self._read(min(skip, self.CHUNK)))
+        content = self._read(entry['length'])
+        self.pos = entry['offset'] + entry['length']
+        return content
+
+class ChunkReader:
+    """
+    readline() and read(n) over an iterator of byte chunks (a streamed
+    response's iter_content(None)), handing out what has arrived without
+    waiting for more than was asked for.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def _fill(self):
+        """Appends the next chunk; False at the end of the stream."""
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        return False
+
+    def readline(self):
+        """Next line with its newline (without one at the end, b"" after it)."""
+        end = self.buffer.find(b"\n")
+        while end < 0:
+            start = len(self.buffer)
+            if not self._fill():
+                end = len(self.buffer) - 1
+                break
+            end = self.buffer.find(b"\n", start)
+        line = bytes(self.buffer[:end + 1])
+        del self.buffer[:end + 1]
+        return line
+
+    def read(self, n):
+        """Up to `n` bytes, fewer only at the end of the stream."""
+        while len(self.buffer) < n and self._fill():
+            pass
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+def init_audio():
+    """
+    Opens the mixer in the PCM format piped to FFmpeg. Without a sound
+    device it falls back to SDL's dummy driver - playback is mixed by
+    PcmChannel anyway, the device is only for local monitoring.
+    """
+    pygame.mixer.quit()
+    try:
+        pygame.mixer.init(frequency=AUDIO_RATE, size=-16, channels=AUDIO_CHANNELS, allowedchanges=0)
+    except pygame.error as e:
+        print(f"[!] No audio device ({e}), mixing without local playback")
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        pygame.mixer.init(frequency=AUDIO_RATE, size=-16, channels=AUDIO_CHANNELS, allowedchanges=0)
+
+class PcmChannel:
+    """
+    Drop-in for a mixer Channel that plays clips by handing their PCM out
+    one video frame at a time (read_frame), so the audio sent to FFmpeg is
+    produced in lockstep with the frames. `monitor` is an optional real
+    Channel that plays the same clips on the local speakers.
+    """
+    def __init__(self, fps=FPS, monitor=None):
+        freq, size, channels = pygame.mixer.get_init()
+        self.rate = freq
+        self.fps = fps
+        self.sample_bytes = channels * abs(size) // 8
+        self.monitor = monitor
+        self.pcm = b""
+        self.pos = 0
+        self.frames = 0
+        self.max_frame_bytes = -(-freq // fps) * self.sample_bytes # ceil
+        self.out = bytearray(self.max_frame_bytes)
+        self.zeros = memoryview(bytes(self.max_frame_bytes))
+
+    def play(self, sound):
+        self.pcm = sound.get_raw()
+        self.pos = 0
+        if self.monitor: self.monitor.play(sound)
+
+    def read_frame(self):
+        """PCM for the next video frame (valid until the next call)."""
+        self.frames += 1
+        samples = self.frames * self.rate // self.fps - (self.frames - 1) * self.rate // self.fps
+        n = samples * self.sample_bytes
+        chunk = memoryview(self.pcm)[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        out = memoryview(self.out)[:n]
+        out[:len(chunk)] = chunk
+        out[len(chunk):] = self.zeros[:n - len(chunk)]
+        return out
+
+class PcmPipe:
+    """
+    Second FFmpeg input carrying the client-mixed PCM: an inherited pipe
+    (pipe:N) on POSIX, a localhost TCP socket FFmpeg listens on elsewhere.
+    """
+    def __init__(self):
+        self.stream = None
+        if os.name == 'posix':
+            self.read_fd, self.write_fd = os.pipe()
+            self.url = f'pipe:{self.read_fd}'
+            self.popen_kwargs = {'pass_fds': (self.read_fd,)}
+        else:
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                self.port = probe.getsockname()[1]
+            self.url = f'tcp://127.0.0.1:{self.port}?listen=1'
+            self.popen_kwargs = {}
+
+    def input_args(self):
+        freq, size, channels = pygame.mixer.get_init()
+        # Tiny probe: the format is given, so FFmpeg needn't buffer seconds
+        # of audio before it starts reading the video pipe again.
+        return ['-thread_queue_size', '512', '-probesize', '32', '-analyzeduration', '0', '-f', 's16le', '-ar', str(freq), '-ac', str(channels), '-i', self.url]
+
+    def connect(self, timeout=10):
+        """Opens the writing end; call once FFmpeg has been spawned."""
+        if os.name == 'posix':
+            os.close(self.read_fd)
+            self.stream = os.fdopen(self.write_fd, 'wb')
+            return self.stream
+        deadline = time.time() + timeout
+        while True:
+            try:
+                sock = socket.create_connection(('127.0.0.1', self.port), timeout=1)
+                break
+            except OSError:
+                if time.time() > deadline: raise
+                time.sleep(0.1)
+        sock.settimeout(None)
+        self.stream = sock.makefile('wb')
+        return self.stream
+
+    def close(self):
+        if self.stream:
+            try: self.stream.close()
+            except OSError: pass
+        elif os.name == 'posix' and self.write_fd is not None:
+            # FFmpeg never started: both ends are still ours
+            for fd in (self.read_fd, self.write_fd):
+                try: os.close(fd)
+                except OSError: pass
+            self.read_fd = self.write_fd = None
+
+def make_http_session(pool_size=AUDIO_FETCH_WORKERS):
+    """requests Session whose connection pool fits all parallel audio fetches"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class StoryPrefetcher:
+    """
+    Background queue that keeps the next stories fetched, with their first
+    clips decoded. Holds at most `depth` stories and stops fetching once the
+    audio it holds exceeds `max_bytes` (one story is always allowed). Held
+    audio is measured before each fetch, so streamed stories that are still
+    growing count at their current size.
+    """
+    def __init__(self, fetch_fn, depth=PREFETCH_DEPTH, max_bytes=PREFETCH_MAX_MB * 1024 * 1024):
+        self.fetch_fn = fetch_fn
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.ready = deque()
+        self.error_msg = ""
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread: return
+        self.thread = threading.Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def queued_bytes(self):
+        return sum(clips.nbytes() for _, clips in self.ready)
+
+    def _has_room(self):
+        if len(self.ready) >= self.depth: return False
+        return not self.ready or self.queued_bytes() < self.max_bytes
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self._has_room():
+                    self.cond.wait()
+                self.error_msg = ""
+            try:
+                data, clips = self.fetch_fn()
+                with self.cond:
+                    self.ready.append((data, clips))
+                    self.error_msg = ""
+                    held = self.queued_bytes()
+                print(f"[*] Prefetched {len(self.ready)}/{self.depth} stories ({held // (1024*1024)} MB)")
+            except Exception as e:
+                print(f"[!] Fetch Error: {e}")
+                with self.cond:
+                    self.error_msg = str(e)
+                time.sleep(FETCH_RETRY_DELAY)
+
+    def pop(self):
+        """Returns the next ready (data, AudioClipPool) payload or None."""
+        with self.cond:
+            if not self.ready: return None
+            payload = self.ready.popleft()
+            self.cond.notify()
+            return payload
+
+class StoryStream:
+    """
+    Reads the rest of a streamed story on a background thread. Each 'line'
+    event's clip comes from clip_for(event): the bytes themselves, read off
+    the stream, or a Future of a download running alongside. A second
+    thread appends the lines to the story's dialogue and AudioClipPool in
+    order, each as soon as its clip is in, so the line needed next is never
+    held up by later ones. When the stream ends, cleanly or not,
+    on_done(clean) is called and then the pool is marked complete.
+    """
+    def __init__(self, resp, events, data, clips, clip_for, on_done=None):
+        self.resp = resp
+        self.events = events
+        self.data = data
+        self.clips = clips
+        self.clip_for = clip_for
+        self.on_done = on_done
+        self.clean = False
+        self.lines = queue.Queue() # (line, clip or Future), None after the last one
+        self.first_line = threading.Event() # set once line 0 is playable (or the stream ended)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        threading.Thread(target=self._append, daemon=True).start()
+
+    def _run(self):
+        try:
+            for raw in self.events:
+                if not raw: continue
+                event = json.loads(raw)
+                if event.get('type') == 'line':
+                    self.lines.put((event['line'], self.clip_for(event)))
+                elif event.get('type') == 'end':
+                    self.clean = True
+                    break
+                elif event.get('type') == 'error':
+                    print(f"[!] Story stream error: {event.get('error')}")
+                    break
+            else:
+                print("[!] Story stream closed before its end")
+        except Exception as e:
+            print(f"[!] Story stream broke off: {e}")
+        finally:
+            self.resp.close()
+            self.lines.put(None)
+
+    def _append(self):
+        try:
+            while True:
+                item = self.lines.get()
+                if item is None: break
+                line, clip = item
+                if isinstance(clip, Future): clip = clip.result()
+                self.clips.append(clip) # before the line: the engine reads both
+                self.data['dialogue'].append(line)
+                self.first_line.set()
+            if self.on_done: self.on_done(self.clean)
+        finally:
+            self.clips.complete.set()
+            self.first_line.set()
+
+class StoryLoader:
+    """
+    Fetches stories in a separate process (MULTIPROCESS). The loader runs
+    the engine's own fetch logic - stream, bundle or clip by clip, with the
+    disk cache - and keeps the clips. A story comes back as a header and
+    then one message per line with its clip length, and grows like a
+    streamed story in a LoaderClipPool. Clips are decoded by the loader as
+    that pool asks for them (pcm()), a decode-ahead window at a time, and
+    dropped there once the pool is released. fetch() is a StoryPrefetcher fetch_fn.
+    """
     def __init__(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.requests = ctx.Queue()
+        self.replies = ctx.Queue()
+        self.pending = queue.Queue() # story headers (or errors) for fetch()
+        self.stories = {} # id -> (data, clips, first_line) still receiving lines
+        self.waiting = {} # pcm() request number -> queue its answer goes to
+        self.requested = 0
+        self.lock = threading.Lock()
+        self.lost = False
+        self.process = ctx.Process(target=run_loader, args=(self.requests, self.replies), name="story-loader", daemon=True)
+        self.process.start()
+        threading.Thread(target=self._receive, name="loader-replies", daemon=True).start()
+
+    def _receive(self):
+        while True:
+            try:
+                kind, story_id, *payload = self.replies.get(timeout=1)
+            except queue.Empty:
+                if self.process.is_alive(): continue
+                # Stories cut short end here, like a broken stream
+                with self.lock:
+                    self.lost = True
+                    for answer in self.waiting.values():
+                        answer.put(None)
+                    self.waiting.clear()
+                for data, clips, first_line in self.stories.values():
+                    clips.complete.set()
+                    first_line.set()
+                self.stories.clear()
+                self.pending.put(Exception("Story loader process exited"))
+                return
+            if kind == 'story':
+                story = self.stories[story_id] = (payload[0], LoaderClipPool(self, story_id), threading.Event())
+                self.pending.put(story)
+            elif kind == 'line':
+                data, clips, first_line = self.stories[story_id]
+                line, duration = payload
+                clips.append(duration) # before the line: the engine reads both
+                data['dialogue'].append(line)
+                first_line.set()
+            elif kind == 'pcm':
+                with self.lock:
+                    answer = self.waiting.pop(story_id, None) # story_id is the request number here
+                if answer: answer.put(payload[0])
+            elif kind == 'end':
+                data, clips, first_line = self.stories.pop(story_id)
+                clips.complete.set()
+                first_line.set()
+            elif kind == 'error':
+                self.pending.put(Exception(payload[0]))
+
+    def fetch(self):
+        """Next story, returned once its first line is playable."""
+        if self.lost: raise Exception("Story loader process exited")
+        self.requests.put('fetch')
+        story = self.pending.get()
+        if isinstance(story, Exception): raise story
+        data, clips, first_line = story
+        first_line.wait()
+        if not data['dialogue']:
+            raise Exception("Story ended without any lines")
+        clips.preload()
+        return data, clips
+
+    def pcm(self, story_id, index):
+        """Mixer PCM of a story's line, decoded by the loader (None if it couldn't be)."""
+        answer = queue.Queue(maxsize=1)
+        with self.lock:
+            if self.lost: return None
+            self.requested += 1
+            request = self.requested
+            self.waiting[request] = answer
+        self.requests.put(('pcm', request, story_id, index))
+        return answer.get()
+
+    def close(self, timeout=2):
+        self.requests.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive(): self.process.terminate()
+
+def run_loader(requests, replies):
+    """
+    Loader process: answers each fetch request with one story, sent line by
+    line, and each pcm request with a decoded clip (see StoryLoader).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the renderer decides when to stop
+    os.environ["SDL_AUDIODRIVER"] = "dummy" # decodes only, never plays
+    init_audio()
+    engine = BroadcastEngine()
+    parent = multiprocessing.parent_process()
+    stories = {} # id -> AudioClipPool, until the renderer releases it
+    story_id = 0
+    while parent.is_alive():
+        try:
+            request = requests.get(timeout=1)
+        except queue.Empty:
+            continue
+        if request is None: break
+        if request == 'fetch':
+            # Fetched on a thread of its own: clips keep being served meanwhile
+            story_id += 1
+            threading.Thread(target=_load_story, args=(engine, replies, story_id, stories), daemon=True).start()
+        elif request[0] == 'pcm':
+            _, number, sid, index = request
+            clips = stories.get(sid)
+            try:
+                # get() releases earlier lines and decodes ahead of the next request
+                sound = clips.get(index) if clips else None
+                pcm = sound.get_raw() if sound else None
+            except pygame.error as e:
+                print(f"[!] Could not decode line {index}: {e}")
+                pcm = None
+            replies.put(('pcm', number, pcm))
+        elif request[0] == 'release':
+            clips = stories.pop(request[1], None)
+            if clips: clips.release()
+
+def _load_story(engine, replies, story_id, stories):
+    try:
+        data, clips = engine._fetch_logic()
+    except Exception as e:
+        replies.put(('error', None, str(e)))
+        return
+    stories[story_id] = clips
+    replies.put(('story', story_id, {**data, 'dialogue': []}))
+    sent = 0
+    while True:
+        complete = clips.complete.wait(0.1) # before reading the lines: none slips past
+        while sent < len(data['dialogue']):
+            replies.put(('line', story_id, data['dialogue'][sent], clips.durations[sent]))
+            sent += 1
+        if complete: break
+    replies.put(('end', story_id))
+
+class StoryTimeline:
+    """
+    Start/end times of every dialogue line of a story, computed from the
+    clip lengths (seconds, None for lines without audio) once, or line by
+    line as a streamed story arrives. at(t) answers which line is on screen
+    and how much of its text is revealed `t` ms into the story.
+    """
+    def __init__(self, dialogue, durations):
+        self.starts = []
+        self.reveal_ms = []
+        self.lengths = []
+        self.end_ms = 0
+        for line, duration in zip(dialogue, durations):
+            self.append(line, duration)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, line, duration, not_before=0):
+        """Adds the next line, starting after the previous one (or at `not_before` ms if that's later)."""
+        length = len(line['text'])
+        if duration:
+            reveal = duration * 1000 # typing matches the speech
+            hold = 0
+        else:
+            reveal = length * CHAR_INTERVAL_MS
+            hold = SILENT_LINE_MS
+        start = max(self.end_ms, not_before)
+        self.starts.append(start)
+        self.reveal_ms.append(reveal)
+        self.lengths.append(length)
+        self.end_ms = start + (reveal + hold + LINE_GAP_MS)
+
+    def at(self, t):
+        """(line index, revealed characters) at `t` ms; index is -1 before the first line."""
+        index = bisect.bisect_right(self.starts, t) - 1
+        if index < 0: return -1, 0
+        elapsed = t - self.starts[index]
+        reveal, length = self.reveal_ms[index], self.lengths[index]
+        if elapsed >= reveal: return index, length
+        return index, int(length * elapsed / reveal)
+
+class BroadcastEngine:
+    def __init__(self, prefetcher=None, channel=None):
         self.state = State.IDLE
         self.story_data = None
-        self.audio_clips = []
+        self.audio_clips = None # AudioClipPool of the story on air
         self.current_index = 0
-        self.channel = pygame.mixer.Channel(0)
+        self.channel = channel or pygame.mixer.Channel(0)
         self.display_text = ""
         self.full_text = ""
-        self.char_timer = 0
-        self.char_interval = 30
-        self.thread_running = False
-        self.next_payload = None
+        self.timeline = None
+        self.story_start = 0
+        if prefetcher is None:
+            # Default source: the story server over HTTP
+            self.http = make_http_session()
+            self.cache = DiskCache()
+            self.audio_pool = ThreadPoolExecutor(max_workers=AUDIO_FETCH_WORKERS, thread_name_prefix="audio")
+            prefetcher = StoryPrefetcher(self._fetch_logic)
+        self.use_stream = STORY_STREAM
+        self.use_bundle = STORY_BUNDLE
+        self.prefetcher = prefetcher
         self.error_msg = ""
         self.wait_start_time = 0
 
-    def start_fetch(self):
-        if self.thread_running: return
-        self.thread_running = True
-        self.error_msg = ""
-        thread = threading.Thread(target=self._fetch_logic)
-        thread.daemon = True
-        thread.start()
+    def now(self):
+        """
+        Engine clock in ms. With a PcmChannel it counts the frames whose
+        audio has been produced, so lines keep pace with the PCM even when
+        rendering runs slow or hitches; wall clock otherwise, virtual when
+        rendering offline.
+        """
+        if isinstance(self.channel, PcmChannel):
+            return self.channel.frames * 1000 / self.channel.fps
+        return pygame.time.get_ticks()
 
     def _fetch_logic(self):
-        try:
-            print(f"[*] Fetching story from {API_URL}...")
-            resp = requests.get(API_URL, timeout=15)
-            
+        if self.use_stream:
+            payload = self._fetch_stream()
+            if payload: return payload
+
+        if self.use_bundle:
+            payload = self._fetch_bundle()
+            if payload: return payload
+
+        print(f"[*] Fetching story from {API_URL}...")
+        resp = self.http.get(API_URL, timeout=15)
+        
+        if resp.status_code != 200:
+            raise Exception(f"HTTP {resp.status_code}")
+        
+        data = resp.json()
+        if 'dialogue' not in data and 'data' in data:
+            data = data['data']
+        
+        if 'dialogue' not in data:
+            raise Exception("JSON missing 'dialogue'")
+
+        print(f"[*] Received: {data.get('original', {}).get('title', 'Untitled')}")
+
+        # Same story id with the same dialogue as last time -> the WAVs on
+        # disk are still valid and are used without touching the network.
+        story_key = f"story:{data.get('original', {}).get('id')}"
+        cached_json, _ = self.cache.get(story_key)
+        trusted = cached_json is not None and self._dialogue_key(json.loads(cached_json)) == self._dialogue_key(data)
+
+        # map() keeps dialogue order; each line fails on its own (None clip)
+        lines = list(enumerate(data['dialogue']))
+        return self._ready(data, self.audio_pool.map(lambda item: self._fetch_audio(*item, trusted=trusted), lines))
+
+    def _fetch_bundle(self):
+        """
+        Story plus audio in one request (BUNDLE_ENDPOINT), read in one pass.
+        Returns None if the server has no bundle endpoint.
+        """
+        print(f"[*] Fetching story bundle from {BUNDLE_URL}...")
+        with self.http.get(BUNDLE_URL, timeout=15, stream=True) as resp:
+            if resp.status_code == 404:
+                print("[!] Server has no bundle endpoint, fetching clips one by one")
+                self.use_bundle = False
+                return None
             if resp.status_code != 200:
                 raise Exception(f"HTTP {resp.status_code}")
-            
-            data = resp.json()
-            if 'dialogue' not in data and 'data' in data:
-                data = data['data']
-            
+
+            reader = BundleReader(resp.raw)
+            data, entries = reader.manifest['story'], reader.manifest['audio']
             if 'dialogue' not in data:
-                raise Exception("JSON missing 'dialogue'")
+                raise Exception("Bundle missing 'dialogue'")
 
             print(f"[*] Received: {data.get('original', {}).get('title', 'Untitled')}")
 
-            audio_objects = []
+            # Cached clips with the served ETag are used from disk; the rest
+            # are read off the stream. Leaving early drops what's unread.
+            blobs = []
             for i, line in enumerate(data['dialogue']):
-                sound = None
-                url = line.get('audioUrl')
-                if url:
-                    if url.startswith('/'): url = f"{API_BASE}{url}"
-                    try:
-                        r = requests.get(url, timeout=10)
-                        if r.status_code == 200:
-                            sound = pygame.mixer.Sound(io.BytesIO(r.content))
-                    except Exception as e:
-                        print(f"[!] Audio download fail line {i}: {e}")
-                audio_objects.append(sound)
-
-            self.next_payload = (data, audio_objects)
+                entry = entries[i] if i < len(entries) else None
+                if not entry:
+                    blobs.append(None)
+                    continue
+                key = urlsplit(line['audioUrl']).path
+                content, cached = self.cache.get(key)
+                if content is None or cached.get('etag') != entry['etag']:
+                    content = reader.clip(entry)
+                    self.cache.put(key, content, entry['etag'])
+                blobs.append(content)
+        return self._ready(data, blobs)
+
+    def _fetch_stream(self):
+        """
+        Story from the NDJSON stream, returned as soon as its first line is
+        playable; a StoryStream keeps appending the rest. Returns None if
+        the server has no stream endpoint.
+        """
+        print(f"[*] Fetching story stream from {STREAM_URL}...")
+        resp = self.http.get(STREAM_URL, params={'clips': 1}, timeout=(15, STREAM_READ_TIMEOUT), stream=True)
+        if resp.status_code == 404:
+            resp.close()
+            print("[!] Server has no stream endpoint, fetching whole stories")
+            self.use_stream = False
+            return None
+        if resp.status_code != 200:
+            resp.close()
+            raise Exception(f"HTTP {resp.status_code}")
+
+        reader = ChunkReader(resp.iter_content(None))
+        events = (raw.strip() for raw in iter(reader.readline, b""))
+        header = json.loads(next(events, None) or '{}')
+        if header.get('type') != 'story':
+            resp.close()
+            raise Exception(header.get('error', "Stream missing story header"))
 
+        data = {'original': header.get('original', {}), 'content': header.get('content', ''), 'dialogue': []}
+        print(f"[*] Receiving: {data['original'].get('title', 'Untitled')} ({header.get('lines')} lines)")
+
+        # Lines unchanged since the cached copy of this story trust their cached WAV
+        story_key = f"story:{data['original'].get('id')}"
+        cached_json, _ = self.cache.get(story_key)
+        known = self._dialogue_key(json.loads(cached_json)) if cached_json else []
+        def fetch(i, line):
+            trusted = i < len(known) and known[i] == (line.get('speaker'), line.get('text'))
+            return self._fetch_audio(i, line, trusted=trusted)
+
+        def clip_for(event):
+            line = event['line']
+            if 'audio' not in event:
+                # A server that doesn't send clips: download it next to the stream
+                return self.audio_pool.submit(fetch, event['index'], line)
+            audio = event['audio']
+            if not audio: return None
+            content = reader.read(audio['length'])
+            if len(content) < audio['length']:
+                raise Exception(f"Stream ended inside the clip of line {event['index']}")
+            if line.get('audioUrl'):
+                self.cache.put(urlsplit(line['audioUrl']).path, content, audio['etag'])
+            return content
+
+        def done(clean):
+            if clean:
+                self.cache.put(story_key, json.dumps(data).encode('utf-8'))
+            self.cache.flush()
+
+        clips = AudioClipPool([], complete=False)
+        stream = StoryStream(resp, events, data, clips, clip_for, on_done=done)
+        stream.first_line.wait()
+        if not data['dialogue']:
+            raise Exception("Story stream ended without any lines")
+        clips.preload()
+        return data, clips
+
+    def _ready(self, data, blobs):
+        """Wraps a fetched story's clips in a pool (first lines decoded) and records the story."""
+        clips = AudioClipPool(blobs)
+        clips.preload()
+
+        self.cache.put(f"story:{data.get('original', {}).get('id')}", json.dumps(data).encode('utf-8'))
+        self.cache.flush()
+        return data, clips
+
+    @staticmethod
+    def _dialogue_key(data):
+        return [(l.get('speaker'), l.get('text')) for l in data.get('dialogue', [])]
+
+    def _fetch_audio(self, i, line, trusted=False):
+        url = line.get('audioUrl')
+        if not url: return None
+        if url.startswith('/'): url = f"{API_BASE}{url}"
+        key = urlsplit(url).path
+        try:
+            content, entry = self.cache.get(key)
+            if content is None or not trusted:
+                # Revalidate (or download) with the validators we were served
+                headers = {}
+                if entry and entry.get('etag'): headers['If-None-Match'] = entry['etag']
+                if entry and entry.get('last_modified'): headers['If-Modified-Since'] = entry['last_modified']
+                r = self.http.get(url, timeout=10, headers=headers)
+                if r.status_code == 200:
+                    content = r.content
+                    self.cache.put(key, content, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+                elif r.status_code != 304:
+                    content = None
+            if content:
+                return content
         except Exception as e:
-            print(f"[!] Fetch Error: {e}")
-            self.error_msg = str(e)
-        finally:
-            self.thread_running = False
+            print(f"[!] Audio download fail line {i}: {e}")
+        return None
 
     def update(self, dt_ms):
-        current_time = pygame.time.get_ticks()
+        current_time = self.now()
 
         if self.state == State.IDLE:
             self.state = State.LOADING
-            self.start_fetch()
+            self.prefetcher.start()
 
         if self.state == State.LOADING:
-            if not self.thread_running:
-                if self.next_payload:
-                    self.story_data, self.audio_clips = self.next_payload
-                    self.next_payload = None
-                    self.current_index = 0
-                    self.state = State.PLAYING
-                    self._setup_line(0)
-                elif self.error_msg:
-                    self.state = State.ERROR
-                    self.wait_start_time = current_time
+            payload = self.prefetcher.pop()
+            if payload:
+                if self.audio_clips: self.audio_clips.release()
+                self.story_data, self.audio_clips = payload
+                self.error_msg = ""
+                self.timeline = StoryTimeline(self.story_data['dialogue'], self.audio_clips.durations)
+                self.story_start = current_time
+                self.current_index = -1
+                self.state = State.PLAYING
+            elif self.prefetcher.error_msg:
+                self.error_msg = self.prefetcher.error_msg
+                self.state = State.ERROR
+                self.wait_start_time = current_time
 
         if self.state == State.PLAYING:
-            if not self.story_data: return
-            if len(self.display_text) < len(self.full_text):
-                self.char_timer += dt_ms
-                if self.char_timer >= self.char_interval:
-                    self.char_timer = 0
-                    self.display_text = self.full_text[:len(self.display_text)+1]
-
-            is_audio_playing = self.channel.get_busy()
-            text_finished = len(self.display_text) >= len(self.full_text)
-            current_audio = self.audio_clips[self.current_index]
-            
-            should_advance = False
-            if current_audio:
-                if not is_audio_playing and text_finished:
-                    should_advance = True
-            else:
-                if text_finished and self.char_timer > 2000:
-                    should_advance = True
-
-            if should_advance:
-                pygame.time.wait(300)
-                self.current_index += 1
-                if self.current_index < len(self.story_data['dialogue']):
-                    self._setup_line(self.current_index)
-                else:
-                    self.state = State.WAITING
-                    self.wait_start_time = current_time
+            # Everything follows from the story's timeline: no polling, no sleeping
+            t = current_time - self.story_start
+            complete = self.audio_clips.complete.is_set() # before extending: no line slips past
+            self._extend_timeline(t)
+            index, revealed = self.timeline.at(t)
+            if index != self.current_index:
+                self.current_index = index
+                self._setup_line(index)
+            if len(self.display_text) != revealed:
+                self.display_text = self.full_text[:revealed]
+
+            # A streamed story may still get lines: hold on the last one
+            if t >= self.timeline.end_ms and complete:
+                self.state = State.WAITING
+                self.wait_start_time = self.story_start + self.timeline.end_ms
 
         if self.state == State.WAITING:
             if current_time - self.wait_start_time > 5000:
                 self.state = State.LOADING
-                self.start_fetch()
 
         if self.state == State.ERROR:
             if current_time - self.wait_start_time > 5000:
                 self.state = State.LOADING
-                self.start_fetch()
+
+    def idle(self):
+        """True while nothing but the background moves: between stories, on errors and once a line is typed out."""
+        if self.state in (State.WAITING, State.ERROR): return True
+        return self.state == State.PLAYING and len(self.display_text) == len(self.full_text)
+
+    def _extend_timeline(self, t):
+        """Adds lines a streamed story received since the last frame; late ones start now."""
+        dialogue = self.story_data['dialogue']
+        while len(self.timeline) < len(dialogue):
+            i = len(self.timeline)
+            self.timeline.append(dialogue[i], self.audio_clips.durations[i], not_before=t)
 
     def _setup_line(self, index):
         line = self.story_data['dialogue'][index]
-        audio = self.audio_clips[index]
+        audio = self.audio_clips.get(index)
         self.full_text = line['text']
         self.display_text = ""
-        self.char_timer = 0
         if audio:
             self.channel.play(audio)
 
 # --- 3. HELPER FUNCTIONS ---
 
-def draw_wrapped_text(surface, text, font, color, rect):
-    words = text.split(' ')
-    lines = []
-    current_line = []
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        w, _ = font.size(test_line)
-        if w < rect.width:
-            current_line.append(word)
+def load_fonts():
+    """(large, medium, mono) fonts used by the scene"""
+    font_large = pygame.font.SysFont("arial", 48, bold=True)
+    font_medium = pygame.font.SysFont("arial", 32)
+    font_mono = pygame.font.SysFont("consolas", 28, bold=True)
+    return font_large, font_medium, font_mono
+
+class WrappedTextLayout:
+    """
+    Word-wraps a dialogue line once and reveals it as the typewriter runs.
+    Rows are rendered a single time; only the row currently being typed is
+    re-rendered, and only when it grows. With a known background colour the
+    drop shadow is baked into one opaque surface per row.
+    """
+    SHADOW_OFFSET = 2
+
+    def __init__(self, text, font, color, width, bg=None):
+        self.text = text
+        self.font = font
+        self.color = color
+        self.bg = bg
+        self.line_h = font.get_linesize()
+        self.rows = self._wrap(text, font, width) # (start, end) offsets into text
+        self.row_blits = {}
+        self.partial = None # (row, revealed chars, blits)
+
+    @staticmethod
+    def _wrap(text, font, width):
+        rows = []
+        start = 0
+        current_line = []
+        for word in text.split(' '):
+            test_line = ' '.join(current_line + [word])
+            w, _ = font.size(test_line)
+            if w < width or not current_line:
+                current_line.append(word)
+            else:
+                end = start + len(' '.join(current_line))
+                rows.append((start, end))
+                start = end + 1
+                current_line = [word]
+        rows.append((start, len(text)))
+        return rows
+
+    def _render(self, text):
+        """Returns [(surface, (dx, dy))] drawing one row with its shadow."""
+        off = self.SHADOW_OFFSET
+        main = self.font.render(text, True, self.color)
+        shadow = self.font.render(text, True, (0,0,0))
+        if self.bg is None:
+            return [(shadow, (off, off)), (main, (0, 0))]
+        surf = pygame.Surface((main.get_width() + off, main.get_height() + off))
+        surf.fill(self.bg)
+        surf.blit(shadow, (off, off))
+        surf.blit(main, (0, 0))
+        return [(surf, (0, 0))]
+
+    def _row_blits(self, row, revealed):
+        start, end = self.rows[row]
+        if revealed >= end:
+            if row not in self.row_blits:
+                self.row_blits[row] = self._render(self.text[start:end])
+            return self.row_blits[row]
+        if not self.partial or self.partial[:2] != (row, revealed):
+            self.partial = (row, revealed, self._render(self.text[start:revealed]))
+        return self.partial[2]
+
+    def draw(self, surface, rect, revealed=None):
+        if revealed is None: revealed = len(self.text)
+        y = rect.y
+        for row, (start, end) in enumerate(self.rows):
+            if y + self.line_h > rect.bottom or revealed <= start: break
+            for surf, (dx, dy) in self._row_blits(row, revealed):
+                surface.blit(surf, (rect.x + dx, y + dy))
+            y += self.line_h
+
+_text_layouts = {}
+
+def draw_wrapped_text(surface, text, font, color, rect, full_text=None, bg=None):
+    """
+    Draws `text` word-wrapped inside rect. When `full_text` is given, `text`
+    is treated as its typewriter prefix: wrapping is computed once for the
+    full line so words don't jump rows while they are being revealed.
+    Pass `bg` when the area behind the text is a solid colour.
+    """
+    full_text = text if full_text is None else full_text
+    key = (font, color, bg, rect.width, full_text)
+    layout = _text_layouts.get(key)
+    if layout is None:
+        if len(_text_layouts) >= 16: _text_layouts.clear()
+        layout = _text_layouts[key] = WrappedTextLayout(full_text, font, color, rect.width, bg)
+    layout.draw(surface, rect, len(text))
+
+class StarField:
+    """
+    Background stars drifting upwards; bigger stars move faster.
+    Positions live in NumPy arrays and every star is rasterised from a
+    pre-computed circle stamp, so update + draw are a few array ops.
+    """
+    COLOR = (50, 50, 60)
+
+    def __init__(self, count=STAR_COUNT, width=WIDTH, height=HEIGHT):
+        self.width, self.height = width, height
+        self.rng = np.random.default_rng()
+        self.x = self.rng.integers(0, width + 1, count).astype(np.float32)
+        self.y = self.rng.integers(0, height + 1, count).astype(np.float32)
+        self.size = self.rng.integers(1, 4, count)
+        self.speed = (self.size * 0.5).astype(np.float32)
+        # One (star indices, stamp dx, stamp dy) group per radius
+        self.groups = [(np.flatnonzero(self.size == r),) + self._stamp(r) for r in np.unique(self.size)]
+
+    @staticmethod
+    def _stamp(radius):
+        """Pixel offsets pygame.draw.circle covers for an integer centre."""
+        c = radius + 1
+        surf = pygame.Surface((2*c + 1, 2*c + 1))
+        pygame.draw.circle(surf, (255, 255, 255), (c, c), radius)
+        dx, dy = np.nonzero(pygame.surfarray.array2d(surf))
+        return dx - c, dy - c
+
+    def update(self):
+        self.y -= self.speed
+        wrapped = self.y < 0
+        if wrapped.any():
+            self.y[wrapped] = self.height
+            self.x[wrapped] = self.rng.integers(0, self.width + 1, int(wrapped.sum()))
+
+    def pixels(self):
+        """Flat (row-major, y * width + x) indices of every star pixel on the canvas."""
+        xi = self.x.astype(np.intp)
+        yi = self.y.astype(np.intp)
+        xs = np.concatenate([(xi[idx, None] + dx).ravel() for idx, dx, dy in self.groups])
+        ys = np.concatenate([(yi[idx, None] + dy).ravel() for idx, dx, dy in self.groups])
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return ys[inside] * self.width + xs[inside]
+
+    def bounds(self):
+        """Rect enclosing every star (empty if there are none)."""
+        if not len(self.x): return pygame.Rect(0, 0, 0, 0)
+        pad = int(self.size.max()) + 1
+        x0, y0 = int(self.x.min()) - pad, int(self.y.min()) - pad
+        rect = pygame.Rect(x0, y0, int(self.x.max()) + pad - x0 + 1, int(self.y.max()) + pad - y0 + 1)
+        return rect.clip(pygame.Rect(0, 0, self.width, self.height))
+
+class SceneRenderer:
+    """
+    Retained-mode compositor for the broadcast scene.
+
+    Everything that only changes with the story / speaker (header bar, LIVE
+    badge, title, dialogue panel, speaker name, loading label) lives in a
+    cached overlay that is repainted only when its inputs change. Each
+    frame then repaints just the dirty regions: the star pixels (written
+    straight into the screen through surfarray) and the text area when
+    the typewriter advanced.
+
+    Stars sit between the background and the overlay. Rather than blending
+    per frame, the overlay is painted onto two layers: `base` (over the
+    background) to erase a star pixel and `starred` (over the star colour)
+    to draw one, which keeps the result identical to drawing the layers in
+    order. Star pixels are read from them through surfarray views. Where
+    the overlay covers a pixel completely both layers agree, and the star
+    is never drawn there.
+
+    A frame that returns no dirty rects is identical to the previous one.
+    With `static` the stars pause while the engine is idle, which makes
+    idle frames identical too.
+    """
+    def __init__(self, screen, font_large, font_medium, font_mono, profiler=None, name=None, static=STATIC_IDLE):
+        self.screen = screen
+        self.static = static
+        self.profiler = profiler
+        self.stage_prefix = f"{name}." if name else "" # profiler stage names
+        self.width, self.height = screen.get_size()
+        self.font_large = font_large
+        self.font_medium = font_medium
+        self.font_mono = font_mono
+        self.base = pygame.Surface((self.width, self.height), 0, screen)    # background + overlay
+        self.starred = pygame.Surface((self.width, self.height), 0, screen) # star colour + overlay
+        self.text_area = None
+        self.key = None
+        self.valid = False # False until the first full paint
+        self.star_xy = (np.empty(0, np.intp),) * 2 # star pixels on screen, surfarray (x, y) indices
+        self.star_bounds = pygame.Rect(0, 0, 0, 0)
+        self.text_key = None
+
+    def _layer_key(self, engine):
+        if engine.state == State.IDLE: return None
+        title = engine.story_data.get('original', {}).get('title', 'Unknown') if engine.story_data else None
+        speaker = None # the panel only changes with the speaker, the line is text
+        if engine.state == State.PLAYING and engine.story_data:
+            speaker = (id(engine.story_data), engine.story_data['dialogue'][engine.current_index]['speaker'])
+        return (title, speaker, engine.state == State.LOADING)
+
+    def _rebuild(self, engine):
+        self.text_area = None
+        W, H = self.width, self.height
+        playing = engine.state == State.PLAYING and engine.story_data
+
+        # Text is rendered once and painted on both layers
+        live = self.font_medium.render("LIVE", True, (255,255,255))
+        title = label = None
+        if engine.story_data:
+            orig = engine.story_data.get('original', {})
+            title = self.font_medium.render(self._fit(orig.get('title', 'Unknown'), W - 150), True, COLOR_TEXT_MAIN)
+        if playing:
+            line = engine.story_data['dialogue'][engine.current_index]
+            spk = line['speaker']
+            is_male = any(x in spk.lower() for x in ['man', 'male'])
+            accent = COLOR_ACCENT_MALE if is_male else COLOR_ACCENT_FEMALE
+            name = self.font_mono.render(spk.upper(), True, accent)
+
+            panel_w = W * (0.9 if H > W else 0.8) # portrait canvases are narrow
+            panel_h = H * 0.5
+            panel_x = (W - panel_w) // 2
+            panel_y = (H - panel_h) // 2
+            self.text_area = pygame.Rect(panel_x + 30, panel_y + 80, panel_w - 60, panel_h - 100)
+        if engine.state == State.LOADING:
+            label = self.font_medium.render("DOWNLOADING STORY...", True, COLOR_TEXT_DIM)
+
+        for layer, color in ((self.base, COLOR_BG), (self.starred, StarField.COLOR)):
+            layer.fill(color)
+            if engine.state == State.IDLE: continue
+
+            pygame.draw.rect(layer, COLOR_PANEL, (0, 0, W, 80))
+            pygame.draw.line(layer, COLOR_BORDER, (0, 80), (W, 80), 2)
+
+            pygame.draw.rect(layer, (220, 20, 20), (30, 20, 70, 40), border_radius=4)
+            layer.blit(live, (45, 25))
+
+            if title: layer.blit(title, (120, 25))
+
+            if playing:
+                pygame.draw.rect(layer, COLOR_PANEL, (panel_x, panel_y, panel_w, panel_h), border_radius=12)
+                pygame.draw.rect(layer, COLOR_BORDER, (panel_x, panel_y, panel_w, panel_h), 2, border_radius=12)
+                pygame.draw.rect(layer, accent, (panel_x, panel_y+20, 6, panel_h-40))
+                layer.blit(name, (panel_x + 30, panel_y + 30))
+
+            if label: layer.blit(label, (W//2 - label.get_width()//2, H - 60))
+
+    def _fit(self, text, max_width):
+        """`text` cut down with an ellipsis until it fits the header."""
+        if self.font_medium.size(text)[0] <= max_width: return text
+        while text and self.font_medium.size(text + "...")[0] > max_width:
+            text = text[:-1]
+        return text.rstrip() + "..."
+
+    def _draw_text(self, engine):
+        if self.text_area:
+            draw_wrapped_text(self.screen, engine.display_text, self.font_large, COLOR_TEXT_MAIN, self.text_area, engine.full_text, COLOR_PANEL)
+
+    def draw(self, engine, stars):
+        """Advances the stars, repaints what changed and returns the dirty rects."""
+        screen = self.screen
+        key = self._layer_key(engine)
+        full = key != self.key or not self.valid
+        if full:
+            self.key = key
+            self.valid = True
+            self._rebuild(engine)
+
+        text_key = (key, engine.current_index, len(engine.display_text)) if self.text_area else None
+        redraw_text = full or (text_key != self.text_key and self.text_area)
+
+        if full:
+            screen.blit(self.base, (0, 0))
+            dirty = [screen.get_rect()]
+        elif redraw_text:
+            screen.blit(self.base, self.text_area, self.text_area)
+            dirty = [self.text_area]
         else:
-            lines.append(' '.join(current_line))
-            current_line = [word]
-    lines.append(' '.join(current_line))
-    
-    y = rect.y
-    line_h = font.get_linesize()
-    for line in lines:
-        if y + line_h > rect.bottom: break
-        surface.blit(font.render(line, True, (0,0,0)), (rect.x+2, y+2))
-        surface.blit(font.render(line, True, color), (rect.x, y))
-        y += line_h
-
-def start_ffmpeg_stream():
-    """Configures FFmpeg to read raw video from STDIN pipe"""
-    if not STREAM_KEY:
-        print("❌ ERROR: YOUTUBE_STREAM_KEY not found in .env")
+            dirty = []
+        self._mark('background')
+        if redraw_text:
+            self._draw_text(engine)
+        self._mark('text')
+
+        moving = not (self.static and engine.idle())
+        if moving or full:
+            if moving: stars.update()
+            y, x = np.divmod(stars.pixels(), self.width)
+            base = pygame.surfarray.pixels2d(self.base)
+            starred = pygame.surfarray.pixels2d(self.starred)
+            visible = base[x, y] != starred[x, y]
+            new = (x[visible], y[visible])
+            old = self.star_xy
+            view = pygame.surfarray.pixels2d(screen)
+            if not full: view[old] = base[old]
+            view[new] = starred[new]
+            del base, starred, view # unlock the surfaces
+
+            bounds = stars.bounds()
+            if not full and (len(old[0]) or len(new[0])):
+                dirty.append(bounds.union(self.star_bounds))
+            self.star_xy = new
+            self.star_bounds = bounds
+        self._mark('stars')
+
+        self.text_key = text_key
+        return dirty
+
+    def _mark(self, stage):
+        if self.profiler: self.profiler.mark(self.stage_prefix + stage)
+
+class FrameExporter:
+    """
+    Moves the screen's pixels into the FFmpeg pipe without per-frame
+    allocations. 'native' hands FFmpeg the surface buffer directly (the
+    pixel format is derived from the surface masks); 'rgb24' and 'yuv420p'
+    convert into buffers allocated once up front.
+    """
+    def __init__(self, surface, fmt=FRAME_FORMAT):
+        self.surface = surface
+        self.width, self.height = surface.get_size()
+        W, H = self.width, self.height
+
+        if fmt == 'native':
+            native = self._native_pix_fmt(surface)
+            if native: self.pix_fmt = native
+            else:
+                print("[!] Screen buffer can't be piped as-is, exporting rgb24")
+                fmt = 'rgb24'
+
+        if fmt == 'rgb24':
+            self.pix_fmt = 'rgb24'
+            self.buffer = bytearray(W * H * 3)
+            self.rgb = np.frombuffer(self.buffer, np.uint8).reshape(H, W, 3)
+        elif fmt == 'yuv420p':
+            if W % 2 or H % 2: raise ValueError("yuv420p export needs even dimensions")
+            self.pix_fmt = 'yuv420p'
+            self.buffer = bytearray(W * H * 3 // 2)
+            planes = np.frombuffer(self.buffer, np.uint8)
+            self.y = planes[:W*H].reshape(H, W)
+            self.u = planes[W*H:W*H + W*H//4].reshape(H//2, W//2)
+            self.v = planes[W*H + W*H//4:].reshape(H//2, W//2)
+            # 16-bit work buffers: luma sums fit uint16, chroma sums int16
+            self.channels = [np.empty((H, W), np.uint16) for _ in range(3)]
+            self.sub = [np.empty((H//2, W//2), np.int16) for _ in range(3)]
+            self.acc = np.empty((H, W), np.uint16)
+            self.tmp = np.empty((H, W), np.uint16)
+            self.sub_acc = np.empty((H//2, W//2), np.int16)
+            self.sub_tmp = np.empty((H//2, W//2), np.int16)
+        elif fmt != 'native':
+            raise ValueError(f"Unknown FRAME_FORMAT '{fmt}'")
+        self.format = fmt
+        self.frame_size = {'native': W * H * surface.get_bytesize(), 'rgb24': W * H * 3, 'yuv420p': W * H * 3 // 2}[fmt]
+
+    @staticmethod
+    def _native_pix_fmt(surface):
+        """FFmpeg name of the surface's in-memory layout, or None."""
+        bpp = surface.get_bytesize()
+        if bpp not in (3, 4) or surface.get_pitch() != surface.get_width() * bpp:
+            return None
+        names = ['0'] * bpp
+        for letter, mask, shift in zip('rgba', surface.get_masks(), surface.get_shifts()):
+            if not mask: continue
+            byte = shift // 8
+            if sys.byteorder == 'big': byte = bpp - 1 - byte
+            names[byte] = letter
+        layout = ''.join(names)
+        if bpp == 3:
+            return {'rgb': 'rgb24', 'bgr': 'bgr24'}.get(layout)
+        return layout if layout in ('bgr0', 'rgb0', '0rgb', '0bgr', 'bgra', 'rgba', 'argb', 'abgr') else None
+
+    def _convert(self):
+        rgb = pygame.surfarray.pixels3d(self.surface).transpose(1, 0, 2) # (H, W, 3) view
+        if self.format == 'rgb24':
+            np.copyto(self.rgb, rgb)
+            return
+        # BT.601 limited range, the same integer approximation swscale uses
+        r, g, b = self.channels
+        for c, out in enumerate(self.channels):
+            np.copyto(out, rgb[:, :, c])
+        del rgb
+        acc, tmp = self.acc, self.tmp
+        np.multiply(r, 66, out=acc)
+        np.multiply(g, 129, out=tmp); acc += tmp
+        np.multiply(b, 25, out=tmp); acc += tmp
+        acc += 128; acc >>= 8; acc += 16
+        np.copyto(self.y, acc, casting='unsafe')
+
+        # 2x2 box average for the chroma planes
+        for full, out in zip(self.channels, self.sub):
+            np.add(full[0::2, 0::2], full[1::2, 0::2], out=out, casting='unsafe')
+            out += full[0::2, 1::2]
+            out += full[1::2, 1::2]
+            out += 2; out >>= 2
+        rs, gs, bs = self.sub
+        acc, tmp = self.sub_acc, self.sub_tmp
+        for plane, (kr, kg, kb) in ((self.u, (-38, -74, 112)), (self.v, (112, -94, -18))):
+            np.multiply(rs, kr, out=acc)
+            np.multiply(gs, kg, out=tmp); acc += tmp
+            np.multiply(bs, kb, out=tmp); acc += tmp
+            acc += 128; acc >>= 8; acc += 128
+            np.copyto(plane, acc, casting='unsafe')
+
+    def export_into(self, out):
+        """Copies the current frame into a writable buffer of frame_size bytes."""
+        if self.format == 'native':
+            view = self.surface.get_view('0')
+            try:
+                out[:] = view
+            finally:
+                del view # unlock the surface
+            return
+        self._convert()
+        out[:] = self.buffer
+
+class FrameWriter:
+    """
+    Decouples the render loop from the FFmpeg pipe. Frames are copied into
+    a ring of pre-allocated slots and a writer thread drains them, so an
+    encoder or upload stall no longer freezes the engine. What happens
+    when the ring is full is decided by `policy` (see FRAME_DROP_POLICY).
+
+    With an `audio_stream`, each frame's PCM is queued alongside it and a
+    second thread writes it, so audio stays frame-locked: a dropped frame
+    drops its audio and a duplicated one gets `audio_size` bytes of silence.
+    The audio side has its own thread because FFmpeg opens its inputs one
+    at a time and wants some audio before it reads the next video frame.
+
+    A frame submitted with `changed=False` is the picture of the previous
+    one: it takes no slot and nothing is copied, the writer sends the last
+    picture again.
+    """
+    POLICIES = ('drop', 'duplicate', 'block')
+    REUSE = -1 # queued in place of a slot: resend the last picture
+
+    def __init__(self, stream, frame_size, slots=FRAME_QUEUE_SIZE, policy=FRAME_DROP_POLICY, fps=FPS,
+                 audio_stream=None, audio_size=0, profiler=None, stage='pipe_write'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown FRAME_DROP_POLICY '{policy}'")
+        self.stream = stream
+        self.policy = policy
+        self.interval = 1.0 / fps
+        self.slots = [bytearray(frame_size) for _ in range(max(2, slots))]
+        self.profiler = profiler # times each pipe write, as `stage`
+        self.stage = stage
+        self.audio_stream = audio_stream
+        self.audio_queued = deque()
+        self.silence = bytes(audio_size)
+        self.free = deque(range(len(self.slots)))
+        self.queued = deque()
+        self.last = None # slot written most recently, kept for duplicates
+        self.has_picture = False # a frame has been queued that REUSE can repeat
+        self.cond = threading.Condition()
+        self.running = True
+        self.error = None
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_duplicated = 0
+        self.frames_reused = 0
+        self.threads = [threading.Thread(target=self._run, name="frame-writer")]
+        if audio_stream:
+            self.threads.append(threading.Thread(target=self._run_audio, name="audio-writer"))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _raise_error(self):
+        if isinstance(self.error, BrokenPipeError): raise self.error
+        raise BrokenPipeError(str(self.error))
+
+    def submit(self, fill, audio=b"", changed=True):
+        """
+        Queues one frame; `fill(buffer)` writes its bytes into the slot and
+        `audio` is the PCM that belongs to it. An unchanged frame (see
+        above) isn't filled.
+        Returns False if the frame was dropped because the ring is full.
+        """
+        pcm = bytes(audio) if self.audio_stream else None
+        with self.cond:
+            if self.error: self._raise_error()
+            reuse = not changed and self.has_picture
+            while len(self.queued) >= len(self.slots) if reuse else not self.free:
+                if self.policy != 'block':
+                    self.frames_dropped += 1
+                    return False
+                self.cond.wait()
+                if self.error: self._raise_error()
+            if reuse:
+                self.queued.append(self.REUSE)
+                if pcm is not None: self.audio_queued.append(pcm)
+                self.cond.notify_all()
+                return True
+            slot = self.free.popleft()
+        fill(memoryview(self.slots[slot]))
+        with self.cond:
+            self.queued.append(slot)
+            self.has_picture = True
+            if pcm is not None: self.audio_queued.append(pcm)
+            self.cond.notify_all()
+        return True
+
+    def has_room(self):
+        """True if submit() would take a frame without dropping it or waiting."""
+        with self.cond:
+            return bool(self.free)
+
+    def _next_slot(self, due):
+        """Blocks until a frame is queued (or a duplicate is due). Returns (slot, is_duplicate)."""
+        with self.cond:
+            while not self.queued and self.running:
+                if self.policy == 'duplicate' and self.last is not None:
+                    # Repeat the last frame once output falls a frame behind schedule
+                    timeout = due + self.interval - time.perf_counter()
+                    if timeout <= 0:
+                        if self.audio_stream:
+                            self.audio_queued.append(self.silence)
+                            self.cond.notify_all()
+                        return self.last, True
+                    self.cond.wait(timeout)
+                else:
+                    self.cond.wait()
+            if not self.queued: return None, False
+            return self.queued.popleft(), False
+
+    def _run(self):
+        start = None
+        sent = 0
+        while True:
+            due = start + sent * self.interval if start is not None else time.perf_counter()
+            slot, duplicate = self._next_slot(due)
+            if slot is None: return
+            try:
+                t = time.perf_counter()
+                self.stream.write(self.slots[self.last if slot == self.REUSE else slot])
+                if self.profiler: self.profiler.record(self.stage, time.perf_counter() - t)
+            except (OSError, ValueError) as e:
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            if start is None: start = time.perf_counter()
+            sent += 1
+            with self.cond:
+                if duplicate:
+                    self.frames_duplicated += 1
+                else:
+                    self.frames_written += 1
+                    if slot == self.REUSE:
+                        self.frames_reused += 1
+                    else:
+                        if self.last is not None: self.free.append(self.last)
+                        self.last = slot
+                    self.cond.notify_all()
+
+    def _run_audio(self):
+        while True:
+            with self.cond:
+                while not self.audio_queued and self.running:
+                    self.cond.wait()
+                if not self.audio_queued: return
+                pcm = self.audio_queued.popleft()
+            try:
+                self.audio_stream.write(pcm)
+            except (OSError, ValueError) as e:
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+
+    def stats(self):
+        with self.cond:
+            return {
+                'written': self.frames_written,
+                'dropped': self.frames_dropped,
+                'duplicated': self.frames_duplicated,
+                'reused': self.frames_reused,
+                'queued': len(self.queued),
+                'capacity': len(self.slots),
+            }
+
+    def close(self, timeout=2):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+class FrameProfiler:
+    """
+    Rolling per-stage timings of the render loop. begin() starts a frame,
+    mark(stage) records the time since the previous mark and end() the
+    whole frame; record() takes a duration measured elsewhere (e.g. on the
+    writer thread). Keeps the last `window` samples of every stage.
+    """
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.start = self.last = time.perf_counter()
+
+    def begin(self):
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.record(stage, now - self.last)
+        self.last = now
+
+    def end(self):
+        self.record('frame', time.perf_counter() - self.start)
+
+    def record(self, stage, seconds):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def snapshot(self):
+        """{stage: {p50, p95, p99, max (ms), n}}"""
+        out = {}
+        for stage, samples in list(self.samples.items()):
+            ms = np.array(samples.copy()) * 1000
+            if not len(ms): continue
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            out[stage] = {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3),
+                          'max': round(ms.max(), 3), 'n': len(ms)}
+        return out
+
+class FfmpegProgress:
+    """
+    Collects FFmpeg's `-progress` output (key=value lines, one block per
+    update ending in progress=...) into the latest structured values.
+    """
+    FIELDS = ('frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'dup_frames', 'drop_frames', 'speed')
+
+    def __init__(self):
+        self.block = {}
+        self.latest = {}
+
+    @staticmethod
+    def _number(value):
+        value = value.strip().rstrip('x').replace('kbits/s', '')
+        try: return float(value) if '.' in value else int(value)
+        except ValueError: return None # N/A
+
+    def feed(self, line):
+        """Consumes one output line; returns False if it isn't progress output."""
+        key, sep, value = line.partition('=')
+        if not sep or not key.isidentifier(): return False
+        if key == 'progress':
+            self.latest = dict(self.block, updated=time.time(), ended=value == 'end')
+            self.block = {}
+        elif key in self.FIELDS:
+            self.block['bitrate_kbps' if key == 'bitrate' else key] = self._number(value)
+        return True
+
+class MetricsReporter:
+    """
+    Logs `snapshot()` as a JSON line every `interval` seconds and, with a
+    port, serves it on http://127.0.0.1:<port>/metrics.
+    """
+    def __init__(self, snapshot, interval=METRICS_INTERVAL, port=METRICS_PORT, min_speed=METRICS_MIN_SPEED):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.min_speed = min_speed
+        self.stopped = threading.Event()
+        self.server = None
+        if port:
+            reporter = self
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = json.dumps(reporter.snapshot()).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                def log_message(self, *args): pass
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"[*] Metrics on http://127.0.0.1:{port}/metrics")
+        if interval > 0:
+            threading.Thread(target=self._run, name="metrics-log", daemon=True).start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            metrics = self.snapshot()
+            print(f"\n[METRICS] {json.dumps(metrics)}")
+            for output in (metrics.get('outputs') or {}).values():
+                for name, profile in (output.get('profiles') or {}).items():
+                    speed = (profile.get('ffmpeg') or {}).get('speed')
+                    if speed is not None and speed < self.min_speed:
+                        print(f"[!] {name} encoder running at {speed}x (< {self.min_speed}x), the stream is falling behind")
+
+    def close(self):
+        self.stopped.set()
+        if self.server: self.server.shutdown()
+
+def start_ffmpeg_stream(pix_fmt='rgb24', audio_pipe=None, size=(WIDTH, HEIGHT), profiles=('landscape',), level=ENCODER_LADDER[0]):
+    """Configures FFmpeg to read raw video from STDIN pipe and PCM from audio_pipe, with one output per profile at an ENCODER_LADDER level"""
+    targets = []
+    for name in profiles:
+        profile = OUTPUT_PROFILES[name]
+        key = os.getenv(profile['key'])
+        if not key:
+            print(f"❌ ERROR: {profile['key']} not found in .env ({name} output disabled)")
+            continue
+        targets.append((profile, profile['url'].format(key=key)))
+    if not targets:
         return None
 
-    cmd = []
-    
     # Common RAW VIDEO input args
     # This tells FFmpeg: "We are sending you raw pixels, not a file"
     input_args = [
         'ffmpeg', '-y',
+        '-nostats', '-progress', 'pipe:1', # key=value progress on stdout
+        '-thread_queue_size', '512',
         '-f', 'rawvideo',
         '-vcodec', 'rawvideo',
-        '-s', f'{WIDTH}x{HEIGHT}', # Must match Pygame surface exactly
-        '-pix_fmt', 'rgb24',       # Pygame outputs RGB
+        '-s', f'{size[0]}x{size[1]}', # Must match Pygame surface exactly
+        '-pix_fmt', pix_fmt,       # Whatever FrameExporter sends
         '-r', str(FPS),
         '-i', '-',                 # Listen to Pipe (STDIN)
     ]
 
-    # OS Specific Audio Args
-    if platform.system() == 'Windows':
-        print("🎥 FFmpeg Windows: Piping raw frames (Window can be minimized)...")
-        # Windows Audio is hard to pipe. We use silent audio for stability.
-        # If you need real audio on Windows, you need 'Stereo Mix' enabled and -f dshow.
-        cmd = input_args + [
-            '-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100',
-        ]
-    else:
-        print("🎥 FFmpeg Linux: Piping raw frames + PulseAudio...")
-        # On Linux, we grab PulseAudio 'monitor' separately
-        cmd = input_args + [
-            '-f', 'pulse', '-i', 'default', 
-        ]
+    # Audio: the PCM we mix ourselves, frame-locked to the video.
+    # No sound server or capture device involved, so it runs headless too.
+    print(f"🎥 FFmpeg: Piping raw frames + PCM audio to {', '.join(p for p in profiles)}...")
+    cmd = input_args + audio_pipe.input_args()
 
-    # Encoding & Output Args
-    output_args = [
-        '-c:v', 'libx264', '-preset', 'veryfast', 
-        '-b:v', '4500k', '-maxrate', '5000k', '-bufsize', '10000k',
-        '-pix_fmt', 'yuv420p', # Convert RGB to YUV for YouTube
-        '-c:a', 'aac', '-b:a', '128k', '-ar', '44100',
-        '-f', 'flv', f'rtmp://a.rtmp.youtube.com/live2/{STREAM_KEY}'
-    ]
+    # Encoding & Output Args, repeated per output (scaled if it's smaller than the canvas)
+    output_args = []
+    for profile, url in targets:
+        bitrate, maxrate, bufsize = profile['bitrate']
+        out_size = tuple(int(d * level['scale']) // 2 * 2 for d in profile['size'])
+        scale = ['-vf', 'scale={}:{}'.format(*out_size)] if out_size != tuple(size) else []
+        rate = ['-r', str(level['fps'])] if level['fps'] != FPS else []
+        output_args += [
+            '-map', '0:v', '-map', '1:a', *scale, *rate,
+            '-c:v', 'libx264', '-preset', level['preset'], 
+            '-b:v', bitrate, '-maxrate', maxrate, '-bufsize', bufsize,
+            '-pix_fmt', 'yuv420p', # Convert RGB to YUV for YouTube
+            '-c:a', 'aac', '-b:a', '128k', '-ar', '44100',
+            '-f', 'flv', url,
+        ]
 
     full_cmd = cmd + output_args
     
     # Open process with STDIN PIPE (for writing video) and STDOUT PIPE (for logs)
-    return subprocess.Popen(full_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    process = subprocess.Popen(full_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **audio_pipe.popen_kwargs)
+    audio_pipe.connect()
+    return process
+
+class EncoderController:
+    """
+    Chooses the ENCODER_LADDER level of one output from its measured encode
+    speed. check() is fed FFmpeg's latest progress plus the frame writer's
+    stats and returns a new level when the output should be restarted with
+    different settings, else None. Slow output only counts against the
+    encoder while frames back up in the writer; if the render loop itself
+    can't deliver FPS, a cheaper encode wouldn't help.
+    """
+    def __init__(self, ladder=ENCODER_LADDER, down_speed=ENCODER_DOWN_SPEED, window=ENCODER_WINDOW,
+                 settle=ENCODER_SETTLE, up_after=ENCODER_UP_AFTER):
+        self.ladder = ladder
+        self.down_speed = down_speed
+        self.window = window
+        self.settle = settle
+        self.up_after = up_after
+        self.level = 0
+        self.samples = deque() # (time, real-time speed between two progress blocks)
+        self.drops = deque()   # (time, frames dropped by the writer so far)
+        self.last = None
+        self.started = time.time()
+        self.healthy_since = None
+        self.probing = False # last change was a step up that hasn't proven itself yet
+        self.changes = deque(maxlen=20)
+
+    def _observe(self, progress):
+        if not progress.get('updated') or progress.get('out_time_us') is None: return
+        if self.last and progress['updated'] > self.last['updated']:
+            wall = progress['updated'] - self.last['updated']
+            media = (progress['out_time_us'] - self.last['out_time_us']) / 1e6
+            self.samples.append((progress['updated'], media / wall))
+        if not self.last or progress['updated'] != self.last['updated']:
+            self.last = progress
+        while self.samples and self.samples[0][0] < progress['updated'] - self.window:
+            self.samples.popleft()
+
+    def speed(self):
+        """Median real-time speed over the window (None without samples)."""
+        if not self.samples: return None
+        return round(float(np.median([v for _, v in self.samples])), 3)
+
+    def _backlogged(self, now, writer):
+        if not writer: return True
+        self.drops.append((now, writer['dropped']))
+        while self.drops[0][0] < now - self.window:
+            self.drops.popleft()
+        return writer['dropped'] > self.drops[0][1] or writer['queued'] >= writer['capacity'] // 2
+
+    def check(self, now, progress, writer=None):
+        self._observe(progress)
+        backlogged = self._backlogged(now, writer)
+        if now - self.started < self.settle + self.window: return None
+        speed = self.speed()
+        if speed is None: return None
+        if speed < self.down_speed and backlogged:
+            self.healthy_since = None
+            if self.probing:
+                # The step up didn't hold; be slower to try again
+                self.up_after = min(self.up_after * 2, 3600)
+                self.probing = False
+            if self.level + 1 < len(self.ladder):
+                return self._change(now, self.level + 1, speed)
+            return None
+        if self.healthy_since is None: self.healthy_since = now
+        self.probing = False
+        if self.level > 0 and now - self.healthy_since >= self.up_after:
+            self.probing = True
+            return self._change(now, self.level - 1, speed)
+        return None
+
+    def _change(self, now, level, speed):
+        self.changes.append({'time': now, 'from': self.level, 'to': level, 'speed': speed, **self.ladder[level]})
+        self.level = level
+        self.restarted(now)
+        return level
+
+    def restarted(self, now):
+        """Forgets what the previous FFmpeg process measured."""
+        self.samples.clear()
+        self.drops.clear()
+        self.last = None
+        self.started = now
+        self.healthy_since = None
+
+    def state(self):
+        return {'level': self.level, **self.ladder[self.level], 'speed': self.speed(),
+                'up_after': self.up_after, 'changes': list(self.changes)}
+
+class EncoderSupervisor:
+    """
+    Restart policy and outage record of one output's FFmpeg. failed()
+    starts (or continues) an outage and returns the seconds until the next
+    restart: none after a process that ran for `reset` seconds, else a
+    backoff doubling from `delay` up to `max_delay`. restarted() ends it.
+    """
+    def __init__(self, delay=ENCODER_RETRY_DELAY, max_delay=ENCODER_RETRY_MAX, reset=ENCODER_RETRY_RESET):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.reset = reset
+        self.down = False
+        self.failures = 0 # in a row
+        self.retry_at = 0
+        self.down_since = None
+        self.up_since = time.time()
+        self.outages = 0
+        self.restarts = 0
+        self.last_error = None
+        self.reconnect_ms = None
+        self.reconnect_ms_max = None
+
+    def failed(self, now, reason):
+        if not self.down:
+            if now - self.up_since >= self.reset: self.failures = 0
+            self.down = True
+            self.down_since = now
+            self.outages += 1
+        self.failures += 1
+        self.last_error = reason
+        backoff = 0 if self.failures == 1 else min(self.max_delay, self.delay * 2 ** (self.failures - 2))
+        self.retry_at = now + backoff
+        return backoff
+
+    def due(self, now):
+        return self.down and now >= self.retry_at
+
+    def restarted(self, now):
+        self.down = False
+        self.up_since = now
+        self.restarts += 1
+        self.reconnect_ms = round((now - self.down_since) * 1000)
+        self.reconnect_ms_max = max(self.reconnect_ms_max or 0, self.reconnect_ms)
+        return self.reconnect_ms
+
+    def state(self):
+        return {'down': self.down, 'outages': self.outages, 'restarts': self.restarts,
+                'reconnect_ms': self.reconnect_ms, 'reconnect_ms_max': self.reconnect_ms_max,
+                'last_error': self.last_error}
+
+class FrameBacklog:
+    """
+    Frames (with their PCM) rendered while an output's FFmpeg is down,
+    handed to the next one as its FrameWriter has room. Holds the last
+    `seconds` of frames at `fps`, dropping the oldest; their buffers are
+    reused until the backlog has drained.
+    """
+    def __init__(self, frame_size, seconds=ENCODER_BACKLOG_SECONDS, fps=FPS):
+        self.frame_size = frame_size
+        self.capacity = int(seconds * fps)
+        self.frames = deque() # (frame, pcm)
+        self.spare = []
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, fill, pcm):
+        """Adds a frame (False if there is no room for any)."""
+        if not self.capacity:
+            self.dropped += 1
+            return False
+        if len(self.frames) >= self.capacity:
+            frame, _ = self.frames.popleft()
+            self.dropped += 1
+        else:
+            frame = self.spare.pop() if self.spare else bytearray(self.frame_size)
+        fill(memoryview(frame))
+        self.frames.append((frame, bytes(pcm)))
+        return True
+
+    def drain(self, writer):
+        """Moves frames into `writer` while it has free slots."""
+        while self.frames and writer.has_room():
+            frame, pcm = self.frames.popleft()
+            def copy(out): out[:] = frame
+            writer.submit(copy, pcm)
+            self.spare.append(frame)
+        if not self.frames:
+            self.spare.clear()
+
+    def stats(self):
+        return {'frames': len(self.frames), 'capacity': self.capacity, 'dropped': self.dropped}
+
+class OutputEncoder:
+    """
+    The FFmpeg side of one output profile, fed by a FrameWriter. It is
+    restarted at another ENCODER_LADDER level whenever the controller asks
+    for one, and by the supervisor when it fails; frames submitted while it
+    is down go to a FrameBacklog, so the caller never has to stop.
+    """
+    def __init__(self, profile, size, pix_fmt, frame_size, audio_size, profiler=None, adaptive=ADAPTIVE_ENCODER):
+        self.profile = profile
+        self.size = size
+        self.pix_fmt = pix_fmt
+        self.frame_size = frame_size
+        self.audio_size = audio_size
+        self.profiler = profiler
+        self.controller = EncoderController() if adaptive else None
+        self.supervisor = EncoderSupervisor()
+        self.backlog = FrameBacklog(frame_size)
+        self.retiring = None # thread shutting the previous FFmpeg down
+        self.switching = None # when a ladder change began, until its FFmpeg is up
+        try:
+            self._start(0)
+        except (OSError, subprocess.SubprocessError) as e:
+            self._fail(time.time(), f"Start failed ({e})")
+
+    def _start(self, level):
+        self.level = level
+        self.progress = FfmpegProgress()
+        self.audio_pipe = PcmPipe()
+        self.started = time.time()
+        self.process = self.writer = None
+        self.process = start_ffmpeg_stream(self.pix_fmt, self.audio_pipe, self.size,
+                                           (self.profile,), ENCODER_LADDER[level])
+        if self.process:
+            self.writer = FrameWriter(self.process.stdin, self.frame_size,
+                                      audio_stream=self.audio_pipe.stream, audio_size=self.audio_size,
+                                      profiler=self.profiler, stage=f'pipe_write:{self.profile}')
+            threading.Thread(target=self._log_ffmpeg, args=(self.process, self.progress), daemon=True).start()
+
+    def _stop(self, process, writer, audio_pipe):
+        # Signalled first, so the writer threads aren't left blocked on a busy FFmpeg
+        if process: process.terminate()
+        if writer:
+            writer.close()
+            print(f"\n[STREAM {self.profile}] Frames: {writer.stats()}")
+        audio_pipe.close()
+        if process:
+            # FFmpeg blocked on a read of stdin only notices SIGTERM at EOF
+            try: process.stdin.close()
+            except OSError: pass
+            try: process.wait(timeout=5)
+            except subprocess.TimeoutExpired: process.kill()
+
+    def _retire(self, failed=False):
+        """Detaches the running FFmpeg and stops it on a thread of its own, off the render loop."""
+        process, writer = self.process, self.writer
+        self.process = self.writer = None
+        # A stuck FFmpeg would keep the writer threads blocked
+        if failed and process: process.kill()
+        self.retiring = threading.Thread(target=self._stop, args=(process, writer, self.audio_pipe), daemon=True)
+        self.retiring.start()
+
+    def _failure(self, now):
+        """Why the running FFmpeg has to be replaced, or None."""
+        if self.process.poll() is not None:
+            return f"FFmpeg exited with code {self.process.returncode}"
+        updated = max(self.progress.latest.get('updated') or 0, self.started)
+        if now - updated > ENCODER_STALL_TIMEOUT:
+            return f"No progress from FFmpeg for {now - updated:.0f}s"
+        return None
+
+    def _fail(self, now, reason):
+        delay = self.supervisor.failed(now, reason)
+        print(f"\n[FFMPEG {self.profile}] {reason}, restarting {f'in {delay:g}s' if delay else 'now'}")
+        self._retire(failed=True)
+
+    def _restart(self, now):
+        switching, self.switching = self.switching, None
+        try:
+            self._start(self.level)
+        except (OSError, subprocess.SubprocessError) as e:
+            self._fail(now, f"Restart failed ({e})")
+            return
+        if not self.process:
+            self._fail(now, "No output to restart")
+            return
+        if self.controller: self.controller.restarted(self.started)
+        if self.supervisor.down:
+            reconnect_ms = self.supervisor.restarted(time.time())
+            print(f"\n[FFMPEG {self.profile}] Restarted after {reconnect_ms} ms, {len(self.backlog)} frames buffered")
+        else:
+            switch_ms = round((time.time() - switching) * 1000)
+            print(f"\n[ENCODER {self.profile}] Switched after {switch_ms} ms, {len(self.backlog)} frames buffered")
+
+    # Logging Thread: progress lines become metrics, errors are printed
+    def _log_ffmpeg(self, process, progress):
+        for line in iter(process.stdout.readline, b''):
+            l = line.decode('utf-8', errors='ignore').strip()
+            if progress.feed(l): continue
+            if any(k in l for k in ["Error", "fail"]):
+                 print(f"\n[FFMPEG {self.profile}] {l}")
+
+    def adapt(self):
+        """
+        Moves to another ladder level if the controller asks for one. The
+        running FFmpeg is stopped in the background and the next submit()
+        starts the new one once it is gone; frames go to the backlog until then.
+        """
+        if not self.controller or not self.process: return
+        now = time.time()
+        level = self.controller.check(now, self.progress.latest, self.writer.stats())
+        if level is None: return
+        change = self.controller.changes[-1]
+        print(f"\n[ENCODER {self.profile}] {json.dumps(change)}")
+        self.level = level
+        self.switching = now
+        self._retire()
+
+    def submit(self, fill, pcm, changed=True):
+        """
+        Queues a frame (see FrameWriter.submit; the backlog always copies).
+        Returns False if it was dropped.
+        """
+        now = time.time()
+        if self.retiring and self.retiring.is_alive():
+            pass # the previous FFmpeg still holds the ingest
+        elif self.switching or self.supervisor.due(now):
+            self._restart(now)
+        elif self.process:
+            reason = self._failure(now)
+            if reason: self._fail(now, reason)
+        if not self.writer:
+            return bool(self.switching or self.supervisor.down) and self.backlog.push(fill, pcm)
+        try:
+            # Frames of an outage go first
+            self.backlog.drain(self.writer)
+            if self.backlog: return self.backlog.push(fill, pcm)
+            return self.writer.submit(fill, pcm, changed)
+        except BrokenPipeError as e:
+            self._fail(now, f"Pipe to FFmpeg broke ({e})")
+            return self.backlog.push(fill, pcm)
+
+    def metrics(self):
+        return {
+            'ffmpeg': self.progress.latest,
+            'writer': self.writer.stats() if self.writer else None,
+            'encoder': self.controller.state() if self.controller else ENCODER_LADDER[self.level],
+            'supervisor': {**self.supervisor.state(), 'backlog': self.backlog.stats()},
+        }
+
+    def close(self):
+        if self.retiring: self.retiring.join()
+        self._stop(self.process, self.writer, self.audio_pipe)
+
+class EncoderGroup:
+    """
+    The encoders of one layout, an OutputEncoder per profile. With more
+    than one, a frame is exported once into a buffer of the group's and
+    copied to each encoder from there.
+    """
+    def __init__(self, profiles, size, pix_fmt, frame_size, audio_size, profiler=None, adaptive=ADAPTIVE_ENCODER):
+        self.encoders = [OutputEncoder(name, size, pix_fmt, frame_size, audio_size, profiler, adaptive) for name in profiles]
+        self.frame = bytearray(frame_size) if len(self.encoders) > 1 else None
+
+    def submit(self, fill, pcm, changed=True):
+        """Queues a frame on every encoder. Returns False if any of them dropped it."""
+        if self.frame is not None:
+            if changed: fill(memoryview(self.frame))
+            frame = self.frame
+            def fill(out): out[:] = frame
+        accepted = [encoder.submit(fill, pcm, changed) for encoder in self.encoders]
+        return all(accepted)
+
+    def adapt(self):
+        for encoder in self.encoders:
+            encoder.adapt()
+
+    def metrics(self):
+        return {'profiles': {encoder.profile: encoder.metrics() for encoder in self.encoders}}
+
+    def close(self):
+        for encoder in self.encoders:
+            encoder.close()
+
+class SharedFrameRing:
+    """
+    Hands one layout's frames to the output process (MULTIPROCESS): slots
+    of one SharedMemory block plus queues of free slot numbers and of
+    filled ones with their frame's PCM. Renderer side it stands in for an
+    EncoderGroup; with no free slot the frame is dropped ('block' waits
+    instead). In the output process serve() feeds the frames to a real
+    EncoderGroup, whose FrameWriters apply FRAME_DROP_POLICY as usual.
+    An unchanged frame still takes a slot, but only as a ticket: the slot
+    of the latest picture stays reserved on the output side to repeat it.
+    """
+    def __init__(self, layout, size, pix_fmt, frame_size, profiles, slots=FRAME_QUEUE_SIZE, policy=FRAME_DROP_POLICY):
+        ctx = multiprocessing.get_context('spawn')
+        self.layout = layout
+        self.size = size
+        self.pix_fmt = pix_fmt
+        self.frame_size = frame_size
+        self.profiles = profiles
+        self.slots = max(2, slots)
+        self.block = policy == 'block'
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_size * self.slots)
+        self.free = ctx.Queue()
+        for slot in range(self.slots):
+            self.free.put(slot)
+        self.filled = ctx.Queue()
+        self.broken = ctx.Event() # the output lost FFmpeg
+        self.closed = ctx.Event() # serve() has shut its encoder down
+        self.conn, self.remote_conn = ctx.Pipe() # metrics requests
+        self.process = None # output process, set once it is started
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.frames_dropped = 0
+        self.has_picture = False
+
+    def __getstate__(self):
+        # What the output process needs; the rest stays with the renderer
+        return {k: v for k, v in self.__dict__.items() if k not in ('process', 'lock', 'conn')}
+
+    def _view(self, slot):
+        return self.shm.buf[slot * self.frame_size:(slot + 1) * self.frame_size]
+
+    def _check(self):
+        if self.broken.is_set() or (self.process and not self.process.is_alive()):
+            raise BrokenPipeError(f"Output process lost the {self.layout} stream")
+
+    def submit(self, fill, pcm, changed=True):
+        """Exports a frame into a free slot. Returns False if it was dropped."""
+        self._check()
+        while True:
+            try:
+                slot = self.free.get(timeout=1) if self.block else self.free.get_nowait()
+                break
+            except queue.Empty:
+                if not self.block:
+                    self.frames_dropped += 1
+                    return False
+                self._check()
+        fresh = changed or not self.has_picture
+        if fresh:
+            fill(self._view(slot))
+            self.has_picture = True
+        self.filled.put((slot, bytes(pcm), fresh))
+        return True
+
+    def adapt(self):
+        pass # the output process adapts its own encoder
+
+    def metrics(self):
+        with self.lock:
+            self.conn.send(None)
+            # A late answer is picked up next time
+            if self.conn.poll(1):
+                while self.conn.poll():
+                    self.latest = self.conn.recv()
+            return {**self.latest, 'ring': {'slots': self.slots, 'dropped': self.frames_dropped}}
+
+    def close(self, timeout=10):
+        self.filled.put(None)
+        if self.process and self.process.is_alive():
+            self.closed.wait(timeout)
+        self.shm.close()
+        self.shm.unlink()
+
+    def serve(self, audio_size, adaptive=ADAPTIVE_ENCODER):
+        """Output process side: feeds the ring's frames to an EncoderGroup until the renderer closes it."""
+        profiler = FrameProfiler()
+        encoder = EncoderGroup(self.profiles, self.size, self.pix_fmt, self.frame_size, audio_size, profiler, adaptive)
+        parent = multiprocessing.parent_process()
+        picture = None # slot holding the latest picture, kept for unchanged frames
+        try:
+            while parent.is_alive():
+                if self.remote_conn.poll():
+                    self.remote_conn.recv()
+                    self.remote_conn.send({**encoder.metrics(), 'stages_ms': profiler.snapshot()})
+                try:
+                    item = self.filled.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is None: break
+                slot, pcm, fresh = item
+                released = slot
+                if fresh: picture, released = slot, picture
+                def copy(out): out[:] = self._view(picture)
+                try:
+                    encoder.submit(copy, pcm, fresh)
+                finally:
+                    if released is not None: self.free.put(released)
+                encoder.adapt()
+        except BrokenPipeError:
+            self.broken.set()
+        finally:
+            encoder.close()
+            self.closed.set()
+
+def start_output_process(rings, audio_size):
+    """Starts the output process serving `rings` (MULTIPROCESS)."""
+    ctx = multiprocessing.get_context('spawn')
+    process = ctx.Process(target=run_output, args=(rings, audio_size), name="stream-output", daemon=True)
+    process.start()
+    for ring in rings:
+        ring.process = process
+    return process
+
+def run_output(rings, audio_size):
+    """Output process: every ring is served by its own thread."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the renderer decides when to stop
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    init_audio() # PcmPipe describes the PCM with the mixer format
+    threads = [threading.Thread(target=ring.serve, args=(audio_size,), name=f"output-{ring.layout}") for ring in rings]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class OutputCanvas:
+    """
+    One layout of the stream: its surface, scene and stars are drawn once
+    per frame and exported to its encoders - an EncoderGroup, or with
+    `shared` a SharedFrameRing read by the output process. Story, audio and
+    text layouts come from the shared engine.
+    """
+    def __init__(self, layout, surface, fonts, profiles, audio, profiler=None, primary=True, adaptive=ADAPTIVE_ENCODER, shared=False):
+        self.layout = layout
+        self.surface = surface
+        self.profiles = profiles
+        self.profiler = profiler
+        self.prefix = "" if primary else f"{layout}." # profiler stage names
+        self.scene = SceneRenderer(surface, *fonts, profiler=profiler, name=None if primary else layout)
+        self.stars = StarField(width=surface.get_width(), height=surface.get_height())
+        self.exporter = FrameExporter(surface)
+        self.changed = True # the screen differs from the last frame the encoder took
+        size = surface.get_size()
+        if shared:
+            self.encoder = SharedFrameRing(layout, size, self.exporter.pix_fmt, self.exporter.frame_size, profiles)
+        else:
+            self.encoder = EncoderGroup(profiles, size, self.exporter.pix_fmt, self.exporter.frame_size,
+                                        audio.max_frame_bytes, profiler, adaptive)
+
+    def adapt(self):
+        self.encoder.adapt()
+
+    def draw(self, engine):
+        dirty = self.scene.draw(engine, self.stars)
+        if dirty: self.changed = True
+        return dirty
+
+    def submit(self, pcm):
+        # An unchanged screen reuses the previous frame instead of being exported again
+        if self.encoder.submit(self.exporter.export_into, pcm, self.changed):
+            self.changed = False
+
+    def metrics(self):
+        return self.encoder.metrics()
+
+    def close(self):
+        self.encoder.close()
 
 # --- 4. MAIN LOOP ---
 
 def main():
     pygame.init()
-    pygame.mixer.init()
+    init_audio()
     
+    # Profiles grouped by the layout they show (one canvas each)
+    layouts = {}
+    for name in OUTPUTS:
+        if name not in OUTPUT_PROFILES:
+            print(f"❌ ERROR: Unknown output profile '{name}' (known: {', '.join(OUTPUT_PROFILES)})")
+            continue
+        profile = OUTPUT_PROFILES[name]
+        # An encoder that can never start would hold its layout's frames back from reuse
+        if not os.getenv(profile['key']):
+            print(f"❌ ERROR: {profile['key']} not found in .env ({name} output disabled)")
+            continue
+        layouts.setdefault(profile['layout'], []).append(name)
+    if not layouts: layouts = {'landscape': []}
+
     # We create the screen, but we don't care if it's visible.
     # We use SCALED so it doesn't take up huge space on dev machine, 
-    # but the internal resolution stays 1920x1080.
+    # but the internal resolution stays that of the first layout (1920x1080).
+    # Further layouts are drawn off-screen.
     flags = pygame.SCALED | pygame.RESIZABLE
     
     # To make it fully "Invisible", you can use flags=pygame.HIDDEN (Experimental)
     # or just minimize it manually.
     
-    screen = pygame.display.set_mode((WIDTH, HEIGHT), flags)
+    screen = pygame.display.set_mode(LAYOUTS[next(iter(layouts))], flags)
     pygame.display.set_caption("Story Stream (Minimize Me!)") 
     clock = pygame.time.Clock()
 
-    font_large = pygame.font.SysFont("arial", 48, bold=True)
-    font_medium = pygame.font.SysFont("arial", 32)
-    font_mono = pygame.font.SysFont("consolas", 28, bold=True)
-
-    engine = BroadcastEngine()
-    stars = [{'x': random.randint(0, WIDTH), 'y': random.randint(0, HEIGHT), 's': random.randint(1,3)} for _ in range(80)]
+    fonts = load_fonts()
 
-    ffmpeg_process = start_ffmpeg_stream()
+    profiler = FrameProfiler()
+    audio = PcmChannel(monitor=pygame.mixer.Channel(0) if AUDIO_MONITOR else None)
+    loader = output_process = None
+    if MULTIPROCESS:
+        print("[*] Multi-process mode: starting the loader and output processes")
+        os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1" # they import pygame again
+        loader = StoryLoader()
+    engine = BroadcastEngine(prefetcher=StoryPrefetcher(loader.fetch) if loader else None, channel=audio)
 
-    # Logging Thread
-    def log_ffmpeg():
-        if ffmpeg_process and ffmpeg_process.stdout:
-            for line in iter(ffmpeg_process.stdout.readline, b''):
-                l = line.decode('utf-8', errors='ignore').strip()
-                if any(k in l for k in ["Error", "fail", "kB/s"]):
-                     if "kB/s" in l: print(f"\r[STREAM] {l}", end="") 
-                     else: print(f"\n[FFMPEG] {l}")
+    outputs = []
+    for layout, profiles in layouts.items():
+        surface = screen if not outputs else pygame.Surface(LAYOUTS[layout], 0, screen)
+        outputs.append(OutputCanvas(layout, surface, fonts, profiles, audio, profiler, primary=not outputs, shared=MULTIPROCESS))
+    if MULTIPROCESS:
+        output_process = start_output_process([o.encoder for o in outputs], audio.max_frame_bytes)
 
-    threading.Thread(target=log_ffmpeg, daemon=True).start()
+    def snapshot():
+        return {
+            'time': time.time(),
+            'state': engine.state,
+            'stages_ms': profiler.snapshot(),
+            'outputs': {o.layout: o.metrics() for o in outputs},
+        }
+    metrics = MetricsReporter(snapshot)
 
     print("\n✅ Stream Started. You can minimize the window now.\n")
 
@@ -289,65 +2572,34 @@ def main():
     try:
         while running:
             dt = clock.tick(FPS)
+            profiler.begin()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT: running = False
 
             engine.update(dt)
+            profiler.mark('update')
 
-            # Draw Everything
-            screen.fill(COLOR_BG)
-            for s in stars:
-                s['y'] -= s['s'] * 0.5
-                if s['y'] < 0:
-                    s['y'] = HEIGHT; s['x'] = random.randint(0, WIDTH)
-                pygame.draw.circle(screen, (50, 50, 60), (int(s['x']), int(s['y'])), s['s'])
-
-            if engine.state != State.IDLE:
-                pygame.draw.rect(screen, COLOR_PANEL, (0, 0, WIDTH, 80))
-                pygame.draw.line(screen, COLOR_BORDER, (0, 80), (WIDTH, 80), 2)
-                
-                pygame.draw.rect(screen, (220, 20, 20), (30, 20, 70, 40), border_radius=4)
-                screen.blit(font_medium.render("LIVE", True, (255,255,255)), (45, 25))
-
-                if engine.story_data:
-                    orig = engine.story_data.get('original', {})
-                    t = font_medium.render(orig.get('title', 'Unknown'), True, COLOR_TEXT_MAIN)
-                    screen.blit(t, (120, 25))
-
-                if engine.state == State.PLAYING and engine.story_data:
-                    line = engine.story_data['dialogue'][engine.current_index]
-                    spk = line['speaker']
-                    is_male = any(x in spk.lower() for x in ['man', 'male'])
-                    accent = COLOR_ACCENT_MALE if is_male else COLOR_ACCENT_FEMALE
-                    
-                    panel_w = WIDTH * 0.8
-                    panel_h = HEIGHT * 0.5
-                    panel_x = (WIDTH - panel_w) // 2
-                    panel_y = (HEIGHT - panel_h) // 2
-                    
-                    pygame.draw.rect(screen, COLOR_PANEL, (panel_x, panel_y, panel_w, panel_h), border_radius=12)
-                    pygame.draw.rect(screen, COLOR_BORDER, (panel_x, panel_y, panel_w, panel_h), 2, border_radius=12)
-                    pygame.draw.rect(screen, accent, (panel_x, panel_y+20, 6, panel_h-40))
-                    
-                    screen.blit(font_mono.render(spk.upper(), True, accent), (panel_x + 30, panel_y + 30))
-                    
-                    text_area = pygame.Rect(panel_x + 30, panel_y + 80, panel_w - 60, panel_h - 100)
-                    draw_wrapped_text(screen, engine.display_text, font_large, COLOR_TEXT_MAIN, text_area)
-
-                if engine.state == State.LOADING:
-                    s = font_medium.render("DOWNLOADING STORY...", True, COLOR_TEXT_DIM)
-                    screen.blit(s, (WIDTH//2 - s.get_width()//2, HEIGHT - 60))
+            # Draw only what changed since the last frame, on every layout
+            dirty = [o.draw(engine) for o in outputs][0]
 
             # Update Display (For local preview)
-            pygame.display.flip()
+            pygame.display.update(dirty)
+            profiler.mark('display')
 
             # --- THE MAGIC: PIPE FRAME TO FFMPEG ---
-            # 1. Get raw pixel data as a string
-            raw_data = pygame.image.tostring(screen, 'RGB')
-            
-            # 2. Write to FFmpeg stdin
-            if ffmpeg_process:
-                ffmpeg_process.stdin.write(raw_data)
+            # The frame (and its slice of the mixed audio) is copied into a
+            # pre-allocated ring slot; the writer thread feeds FFmpeg so
+            # encoder stalls don't stall rendering. Audio is mixed once and
+            # shared by every output.
+            pcm = audio.read_frame()
+            for o in outputs:
+                o.submit(pcm)
+                profiler.mark(o.prefix + 'export')
+            profiler.end()
+
+            # Step encoders down (or back up) to stay real-time
+            for o in outputs:
+                o.adapt()
             # ---------------------------------------
 
     except KeyboardInterrupt:
@@ -355,9 +2607,172 @@ def main():
     except BrokenPipeError:
         print("\n[FFMPEG] Broken Pipe. FFmpeg likely crashed.")
     finally:
-        if ffmpeg_process: ffmpeg_process.terminate()
+        metrics.close()
+        for o in outputs:
+            o.close()
+        if output_process: output_process.join(5)
+        if loader: loader.close()
         pygame.quit()
         sys.exit()
 
+# --- 5. OFFLINE RENDERING ---
+
+class StaticStories:
+    """Prefetcher stand-in that hands out already loaded payloads."""
+    def __init__(self, payloads):
+        self.ready = deque(payloads)
+        self.error_msg = ""
+
+    def start(self):
+        pass
+
+    def pop(self):
+        return self.ready.popleft() if self.ready else None
+
+class OfflineEngine(BroadcastEngine):
+    """
+    BroadcastEngine driven by a virtual clock instead of wall time, so a
+    story renders as fast as the CPU allows.
+    """
+    def __init__(self, payload):
+        super().__init__(prefetcher=StaticStories([payload]), channel=PcmChannel())
+        self.clock_ms = 0
+
+    def now(self):
+        return self.clock_ms
+
+def resolve_story_path(story):
+    """Accepts a story id, a story folder or a story JSON file."""
+    if os.path.isfile(story): return story
+    folder = story if os.path.isdir(story) else os.path.join(GENERATED_STORIES_DIR, story)
+    path = os.path.join(folder, f"{os.path.basename(os.path.normpath(folder))}.json")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No story JSON for '{story}' ({path})")
+    return path
+
+def load_local_story(path):
+    """Loads a generated story and its <index>.wav clips from disk."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    folder = os.path.dirname(path)
+    blobs = []
+    for i in range(len(data['dialogue'])):
+        wav = os.path.join(folder, f"{i}.wav")
+        if os.path.isfile(wav):
+            with open(wav, 'rb') as f:
+                blobs.append(f.read())
+        else:
+            blobs.append(None)
+    clips = AudioClipPool(blobs)
+    clips.preload()
+    return data, clips
+
+def _init_headless():
+    if pygame.get_init(): return
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+    init_audio()
+    pygame.display.set_mode((WIDTH, HEIGHT))
+
+def render_story(story, out_dir, threads=0):
+    """Renders one story to <out_dir>/<id>.mp4 on a virtual clock. Returns a stats dict."""
+    _init_headless()
+    started = time.perf_counter()
+    path = resolve_story_path(story)
+    data, clips = load_local_story(path)
+    story_id = data.get('original', {}).get('id') or os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{story_id}.mp4")
+
+    screen = pygame.display.get_surface()
+    engine = OfflineEngine((data, clips))
+    stars = StarField()
+    scene = SceneRenderer(screen, *load_fonts())
+    exporter = FrameExporter(screen)
+    frame_ms = 1000 / FPS
+
+    audio_pipe = PcmPipe()
+    encoder = subprocess.Popen([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-thread_queue_size', '512',
+        '-f', 'rawvideo', '-vcodec', 'rawvideo',
+        '-s', f'{WIDTH}x{HEIGHT}', '-pix_fmt', exporter.pix_fmt,
+        '-r', str(FPS), '-i', '-',
+        *audio_pipe.input_args(),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20',
+        '-threads', str(threads), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-movflags', '+faststart', out_path,
+    ], stdin=subprocess.PIPE, **audio_pipe.popen_kwargs)
+    # 'block' never drops, and the writer threads keep audio ahead of video
+    # the way FFmpeg needs it while it opens the inputs
+    writer = FrameWriter(encoder.stdin, exporter.frame_size, policy='block',
+                         audio_stream=audio_pipe.connect(), audio_size=engine.channel.max_frame_bytes)
+
+    frames = 0
+    done_at = None
+    try:
+        while done_at is None or engine.clock_ms < done_at:
+            engine.clock_ms = frames * frame_ms
+            engine.update(frame_ms)
+            dirty = scene.draw(engine, stars)
+            writer.submit(exporter.export_into, engine.channel.read_frame(), changed=bool(dirty))
+            frames += 1
+            if done_at is None and engine.state == State.WAITING:
+                done_at = engine.clock_ms + RENDER_TAIL_MS
+    finally:
+        writer.close(timeout=None)
+        encoder.stdin.close()
+        audio_pipe.close()
+    if writer.error or encoder.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed encoding {story_id}")
+    duration_ms = frames * frame_ms
+
+    elapsed = time.perf_counter() - started
+    return {
+        'story': story_id, 'output': out_path, 'frames': frames,
+        'duration_s': round(duration_ms / 1000, 2), 'render_s': round(elapsed, 2),
+        'speed': round(duration_ms / 1000 / elapsed, 2),
+    }
+
+def render_stories(stories, out_dir, jobs=None):
+    """Renders stories to MP4, in parallel across `jobs` processes."""
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(stories)))
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    print(f"🎬 Rendering {len(stories)} stories with {jobs} worker(s)...")
+    results = []
+    if jobs == 1:
+        outcomes = (_render_safe(s, out_dir, threads) for s in stories)
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        outcomes = pool.map(_render_safe, stories, [out_dir] * len(stories), [threads] * len(stories))
+    for result in outcomes:
+        results.append(result)
+        if 'error' in result: print(f"[!] {result['story']}: {result['error']}")
+        else: print(f"[*] {result['story']}: {result['duration_s']}s of video in {result['render_s']}s ({result['speed']}x) -> {result['output']}")
+    if jobs > 1: pool.shutdown()
+    return results
+
+def _render_safe(story, out_dir, threads):
+    try:
+        return render_story(story, out_dir, threads)
+    except Exception as e:
+        return {'story': story, 'error': str(e)}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Story livestream client")
+    parser.add_argument('--render', nargs='*', metavar='STORY',
+                        help="render stories (ids, folders or JSON files) to MP4 instead of streaming; "
+                             "with no STORY every story in GENERATED_STORIES_DIR is rendered")
+    parser.add_argument('--out', default='renders', help="output folder for --render (default: renders)")
+    parser.add_argument('--jobs', type=int, default=None, help="parallel render processes (default: CPU count)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.render is not None:
+        stories = args.render or sorted(d for d in os.listdir(GENERATED_STORIES_DIR) if os.path.isdir(os.path.join(GENERATED_STORIES_DIR, d)))
+        results = render_stories(stories, args.out, args.jobs)
+        sys.exit(1 if any('error' in r for r in results) else 0)
     main()
\ No newline at end of file
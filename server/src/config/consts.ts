@@ -10,10 +10,21 @@ const __DIRNAME = import.meta.dirname;
 dotenv.config({ path: resolve(__DIRNAME, '../../.env') });
 
 export const FRESH_STORIES_AMOUNT = 5;
+// Story generation stages: scripts (LLM requests) and audio (each story's
+// lines already spread over the Piper pool) running at once
+export const STORY_SCRIPT_CONCURRENCY = Number(process.env.STORY_SCRIPT_CONCURRENCY) || 2;
+export const STORY_AUDIO_CONCURRENCY = Number(process.env.STORY_AUDIO_CONCURRENCY) || 1;
+export const STORY_RETRY_DELAY_MS = 5000;
+// How long a request waits for a story when none is ready
+export const STORY_WAIT_TIMEOUT_MS = 60000;
 export const API_BASE = 'http://localhost:4000';
 export const STORIES_DIR = resolve(__DIRNAME, '../../stories');
 export const GENERATED_STORIES_DIR = resolve(__DIRNAME, '../../public/generated-stories');
 
+// Synthesized lines keyed by voice + cleaned text, shared by all stories (LRU over the cap)
+export const TTS_CACHE_DIR = process.env.TTS_CACHE_DIR || resolve(__DIRNAME, '../../tts-cache');
+export const TTS_CACHE_MAX_MB = Number(process.env.TTS_CACHE_MAX_MB) || 1024;
+
 // 3. Determine Piper Path
 const ENV_PIPER_PATH = process.env.PIPER_PATH;
 
@@ -27,6 +38,12 @@ export const PIPER_EXECUTABLE_PATH = ENV_PIPER_PATH || LOCAL_PIPER_PATH;
 // Resolve models relative to the executable path
 export const PIPER_MODELS_PATH = path.resolve(path.dirname(PIPER_EXECUTABLE_PATH), 'models');
 
+// Long-lived Piper processes per voice model. The two voices alternate
+// through a story, so each gets half the cores by default.
+export const PIPER_WORKERS_PER_MODEL = Number(process.env.PIPER_WORKERS_PER_MODEL) || Math.max(1, Math.ceil(os.availableParallelism() / 2));
+// A worker that finishes nothing for this long is considered hung and killed
+export const PIPER_JOB_TIMEOUT_MS = Number(process.env.PIPER_JOB_TIMEOUT_MS) || 60000;
+
 console.log(`Using Piper at: ${PIPER_EXECUTABLE_PATH}`);
 
 export const STORY_SYSTEM_PROMPT = `
@@ -6,47 +6,16 @@ dotenv.config({ path: path.resolve(__DIRNAME, '../../.env') });
 
 import express, { Request, Response } from 'express';
 import cors from 'cors';
-import { generateStory } from './utils/index.js';
+import { StoryPipeline } from './lib/storyPipeline.js';
+import { readClip, writeStoryBundle } from './lib/storyBundle.js';
 import { GeneratedStory } from './common/types.js';
 import { GENERATED_STORIES_DIR, FRESH_STORIES_AMOUNT } from './config/consts.js';
 
-// We only need one main cache array
-const freshStories: GeneratedStory[] = [];
-let isGeneratingStory = false;
-
-async function ensureFreshStories() {
-    // If we have room for more stories AND we aren't currently making one
-    if (freshStories.length < FRESH_STORIES_AMOUNT && !isGeneratingStory) {
-        isGeneratingStory = true; // LOCK
-        console.log("Refilling stories...");
-        try {
-            const freshStory = await generateStory();
-            freshStories.push(freshStory);
-            console.log(`Story generated. Cache size: ${freshStories.length}`);
-        } catch (error) {
-            console.error("Error in background generation:", error);
-        } finally {
-            isGeneratingStory = false; // UNLOCK
-        }
-    }
-}
-
-async function main() {
-    console.log("Initializing... Generating first story...");
-    try {
-        const generatedStory = await generateStory();
-        freshStories.push(generatedStory);
-        console.log(`\nInitialization complete. Cache ready.`);
-    } catch (e) {
-        console.error("Failed to generate initial story:", e);
-    }
-
-    // Check for new stories every 5 seconds
-    setInterval(ensureFreshStories, 5000);
-}
+// Stories ready to serve, topped up as soon as one is taken
+const storyPipeline = new StoryPipeline(FRESH_STORIES_AMOUNT);
 
-// Start the background generation
-main();
+console.log("Initializing... Generating first stories...");
+storyPipeline.refill();
 
 const app = express();
 app.use(cors());
@@ -58,40 +27,125 @@ app.listen(port, () => {
     console.log(`Server is running on port ${port}`);
 });
 
+/** Points every dialogue line at its WAV under the static /stories route */
+function withAudioUrls(story: GeneratedStory, req: Request): GeneratedStory {
+    const protocol = req.protocol;
+    const host = req.get('host');
+    const baseUrl = `${protocol}://${host}`;
+    const storyId = story.original.id;
+    const storyResourcePath = `${baseUrl}/stories/${storyId}`;
+
+    const dialogueWithAudio = story.dialogue.map((line, idx) => {
+        return {
+            ...line,
+            audioUrl: `${storyResourcePath}/${idx}.wav`
+        };
+    });
+    story.dialogue = dialogueWithAudio;
+    return story;
+}
+
 app.get("/story", async (req: Request, res: Response) => {
     try {
-        // Handle empty cache case
-        if (freshStories.length === 0) {
-            console.log("Cache empty! Generating story on-demand...");
-            const emergencyStory = await generateStory();
-            freshStories.push(emergencyStory);
+        const story = await storyPipeline.take();
+
+        if (!story) {
+            return res.status(503).json({ error: "No stories available yet. Please try again in a moment." });
         }
 
-        ensureFreshStories();
+        return res.json(withAudioUrls(story, req));
+
+    } catch (error: any) {
+        console.error("Error serving story:", error);
+        res.status(500).json({ error: "Failed to generate story", details: error.message });
+    }
+});
 
-        const story = freshStories.shift();
+// Same story as /story plus all of its audio in one streamed response (see lib/storyBundle.ts)
+app.get("/story/bundle", async (req: Request, res: Response) => {
+    try {
+        const story = await storyPipeline.take();
 
         if (!story) {
             return res.status(503).json({ error: "No stories available yet. Please try again in a moment." });
         }
 
-        const protocol = req.protocol;
-        const host = req.get('host');
-        const baseUrl = `${protocol}://${host}`;
-        const storyId = story.original.id;
-        const storyResourcePath = `${baseUrl}/stories/${storyId}`;
-
-        const dialogueWithAudio = story.dialogue.map((line, idx) => {
-            return {
-                ...line,
-                audioUrl: `${storyResourcePath}/${idx}.wav`
-            };
+        const storyDir = path.resolve(GENERATED_STORIES_DIR, story.original.id);
+        await writeStoryBundle(res, withAudioUrls(story, req), storyDir);
+
+    } catch (error: any) {
+        // The client hung up early (it had the remaining clips cached)
+        if (res.destroyed) {
+            return;
+        }
+        console.error("Error serving story bundle:", error);
+        if (res.headersSent) {
+            return res.destroy();
+        }
+        res.status(500).json({ error: "Failed to generate story", details: error.message });
+    }
+});
+
+/**
+ * Progressive delivery, one JSON object per line (NDJSON):
+ *   { type: 'story', original, content, lines }  - as soon as the script exists
+ *   { type: 'line', index, line }                 - in order, once each line has audio
+ *   { type: 'end' } | { type: 'error', error }
+ * A client can start playing line 0 while later lines are still in TTS.
+ *
+ * With `?clips=1` every line event also carries `audio: { length, etag }`
+ * (null without a WAV) and is followed by that many bytes of WAV, so the
+ * whole story takes one request, like a bundle.
+ */
+app.get("/story/stream", async (req: Request, res: Response) => {
+    const withClips = req.query.clips === '1';
+    const send = (event: object, clip?: Buffer) => {
+        if (!res.destroyed) {
+            res.write(JSON.stringify(event) + "\n");
+            if (clip) {
+                res.write(clip);
+            }
+        }
+    };
+
+    try {
+        const progress = await storyPipeline.takeProgressive();
+
+        if (!progress) {
+            return res.status(503).json({ error: "No stories available yet. Please try again in a moment." });
+        }
+
+        const story = withAudioUrls(progress.story, req);
+        res.setHeader('Content-Type', 'application/x-ndjson');
+        res.setHeader('Cache-Control', 'no-cache');
+        send({ type: 'story', original: story.original, content: story.content, lines: story.dialogue.length });
+
+        // Clips are read from disk in turn, so lines still go out in order
+        const storyDir = path.resolve(GENERATED_STORIES_DIR, story.original.id);
+        let sending: Promise<void> = Promise.resolve();
+        const sendLine = async (index: number) => {
+            const event = { type: 'line', index, line: story.dialogue[index] };
+            if (!withClips) {
+                return send(event);
+            }
+            const clip = await readClip(path.resolve(storyDir, `${index}.wav`));
+            const audio = clip && { length: clip.data.length, etag: clip.etag };
+            send({ ...event, audio }, clip?.data);
+        };
+        await progress.forEachLine((index) => {
+            sending = sending.then(() => sendLine(index));
+            sending.catch(() => { }); // a failed read surfaces at the await below
         });
-        story.dialogue = dialogueWithAudio;
-        return res.json(story);
+        await sending;
+        send({ type: 'end' });
+        res.end();
 
     } catch (error: any) {
-        console.error("Error serving story:", error);
+        console.error("Error streaming story:", error);
+        if (res.headersSent) {
+            send({ type: 'error', error: error.message });
+            return res.end();
+        }
         res.status(500).json({ error: "Failed to generate story", details: error.message });
     }
-});
\ No newline at end of file
+});
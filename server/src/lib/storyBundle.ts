@@ -0,0 +1,90 @@
+import path from "path";
+import { createReadStream } from "fs";
+import { readFile, stat } from "fs/promises";
+import { pipeline } from "stream/promises";
+import { Response } from "express";
+import { GeneratedStory } from "../common/types.js";
+
+/**
+ * A story bundle is the story JSON and all of its audio in one response:
+ *
+ *   [manifest length: u32 big-endian][manifest JSON][clip 0][clip 1]...
+ *
+ * The manifest is `{ story, audio }`. `audio[i]` locates line i's WAV in
+ * the data after the manifest, or is null when the line has no audio.
+ * The etags are the ones express.static serves the same files with, so a
+ * client can skip clips it already has cached.
+ */
+export const BUNDLE_CONTENT_TYPE = 'application/vnd.story-bundle';
+
+export interface BundleEntry {
+    offset: number
+    length: number
+    etag: string
+}
+
+export interface BundleManifest {
+    story: GeneratedStory
+    audio: (BundleEntry | null)[]
+}
+
+/** Weak ETag in the format express.static (serve-static) uses for a file */
+function weakEtag(size: number, mtime: Date): string {
+    return `W/"${size.toString(16)}-${mtime.getTime().toString(16)}"`
+}
+
+/** A WAV with the ETag express.static serves it with, or null if there is none */
+export async function readClip(file: string): Promise<{ data: Buffer, etag: string } | null> {
+    const fileStat = await stat(file).catch(() => null)
+    if (!fileStat || !fileStat.isFile() || fileStat.size === 0) {
+        return null
+    }
+    const data = await readFile(file)
+    return { data, etag: weakEtag(data.length, fileStat.mtime) }
+}
+
+/**
+ * Streams a story and its WAVs (`<storyDir>/<line>.wav`) as a bundle.
+ * Clips are piped from disk one after another, never fully buffered.
+ */
+export async function writeStoryBundle(res: Response, story: GeneratedStory, storyDir: string): Promise<void> {
+    const files = story.dialogue.map((_, idx) => path.resolve(storyDir, `${idx}.wav`))
+    const stats = await Promise.all(files.map(file => stat(file).catch(() => null)))
+
+    let offset = 0
+    const audio: (BundleEntry | null)[] = stats.map((fileStat) => {
+        if (!fileStat || !fileStat.isFile() || fileStat.size === 0) {
+            return null
+        }
+        const entry = { offset, length: fileStat.size, etag: weakEtag(fileStat.size, fileStat.mtime) }
+        offset += fileStat.size
+        return entry
+    })
+
+    const manifest: BundleManifest = { story, audio }
+    const manifestBytes = Buffer.from(JSON.stringify(manifest), 'utf-8')
+    const header = Buffer.alloc(4)
+    header.writeUInt32BE(manifestBytes.length)
+
+    res.setHeader('Content-Type', BUNDLE_CONTENT_TYPE)
+    res.setHeader('Content-Length', header.length + manifestBytes.length + offset)
+    res.write(header)
+    res.write(manifestBytes)
+
+    for (let i = 0; i < files.length; i++) {
+        const entry = audio[i]
+        if (!entry) {
+            continue
+        }
+        // Client already has the rest (it stops reading once it does)
+        if (res.destroyed) {
+            return
+        }
+        const clip = createReadStream(files[i], { end: entry.length - 1 })
+        await pipeline(clip, res, { end: false })
+        if (clip.bytesRead !== entry.length) {
+            throw new Error(`${files[i]} changed while it was being sent`)
+        }
+    }
+    res.end()
+}
@@ -4,48 +4,104 @@ import { ttsPiper } from "../services/ai/tts.js";
 import { GENERATED_STORIES_DIR, STORIES_DIR, STORY_SYSTEM_PROMPT } from "../config/consts.js";
 import fs, { access, constants } from 'fs';
 import fsp, { readFile, mkdir } from 'fs/promises';
-import { safe, checkFileExists, ensureDirectory, getWavCount, readAndParseJson } from "../utils/index.js";
+import { safe, checkFileExists, ensureDirectory, readAndParseJson, removeWavs } from "../utils/index.js";
 import { askNvidiaAI, nvidiaModels } from "../services/ai/index.js";
 
+const DIALOGUE_PATTERN = /(Man|Woman):\s*([\s\S]+?)(?=\s*(?:Man|Woman):|$)/gi;
+
+function toDialogueLine(match: RegExpMatchArray): DialogueLine | null {
+    const speakerStr = match[1].toLowerCase();
+
+    if (speakerStr === 'man' || speakerStr === 'woman') {
+        const text = match[2].trim();
+
+        if (text.length > 0) {
+            return {
+                speaker: speakerStr,
+                text,
+                audioUrl: null,
+            };
+        }
+    }
+    return null;
+}
+
 export function parseDialogue(input: string): DialogueLine[] {
     const dialogueLines: DialogueLine[] = [];
-    const regex = /(Man|Woman):\s*([\s\S]+?)(?=\s*(?:Man|Woman):|$)/gi;
-
-    let match;
-    while ((match = regex.exec(input)) !== null) {
-        const speakerStr = match[1].toLowerCase();
-
-        if (speakerStr === 'man' || speakerStr === 'woman') {
-            const text = match[2].trim();
-
-            if (text.length > 0) {
-                dialogueLines.push({
-                    speaker: speakerStr,
-                    text,
-                    audioUrl: null,
-                });
-            }
+
+    for (const match of input.matchAll(DIALOGUE_PATTERN)) {
+        const line = toDialogueLine(match);
+        if (line) {
+            dialogueLines.push(line);
         }
     }
 
     return dialogueLines;
 }
 
-export async function generateStoryAudio({
-    story,
-    outputDir
-}: { story: GeneratedStory; outputDir: string }) {
-    const wavFilesCount = await getWavCount(outputDir)
-    if (wavFilesCount === story.dialogue.length) {
-        return
+/**
+ * parseDialogue for text that is still streaming in. push() each token;
+ * `onLine` gets every line as soon as the next speaker tag closes it, and
+ * end() flushes the last one. The lines are exactly what parseDialogue
+ * returns for the whole text.
+ */
+export class DialogueStreamParser {
+    lines: DialogueLine[] = [];
+    // Text from the start of the line still open (its speaker tag) on
+    private buffer = "";
+
+    constructor(private onLine: (line: DialogueLine, index: number) => void = () => { }) { }
+
+    push(token: string) {
+        this.buffer += token;
+        const matches = [...this.buffer.matchAll(DIALOGUE_PATTERN)];
+        if (matches.length < 2) {
+            return;
+        }
+        for (const match of matches.slice(0, -1)) {
+            this.emit(match);
+        }
+        this.buffer = this.buffer.slice(matches[matches.length - 1].index);
+    }
+
+    end(): DialogueLine[] {
+        for (const match of this.buffer.matchAll(DIALOGUE_PATTERN)) {
+            this.emit(match);
+        }
+        this.buffer = "";
+        return this.lines;
     }
-    for (let i = 0; i < story.dialogue.length; i++) {
-        const dialogueLine: DialogueLine = story.dialogue[i]
-        const outputTts = path.resolve(outputDir, `${i}.wav`)
-        await ttsPiper({ text: dialogueLine.text, outputPath: outputTts, model: dialogueLine.speaker as PiperModel })
+
+    private emit(match: RegExpMatchArray) {
+        const line = toDialogueLine(match);
+        if (line) {
+            this.lines.push(line);
+            this.onLine(line, this.lines.length - 1);
+        }
     }
 }
 
+function synthesizeLine(dialogueLine: DialogueLine, index: number, outputDir: string): Promise<string> {
+    const outputTts = path.resolve(outputDir, `${index}.wav`)
+    return ttsPiper({ text: dialogueLine.text, outputPath: outputTts, model: dialogueLine.speaker as PiperModel })
+}
+
+export async function generateStoryAudio({
+    story,
+    outputDir,
+    started,
+    onLine
+}: { story: GeneratedStory; outputDir: string; started?: Map<number, Promise<string>>; onLine?: (index: number) => void }) {
+    // Every line on its own: ones already on disk or in the TTS cache cost
+    // a stat, ones started while the script streamed in are awaited, the
+    // rest go to the Piper pool all at once. Each <i>.wav lands (and is
+    // reported to onLine) whenever its line is done
+    await Promise.all(story.dialogue.map(async (dialogueLine: DialogueLine, i) => {
+        await (started?.get(i) ?? synthesizeLine(dialogueLine, i, outputDir))
+        onLine?.(i)
+    }))
+}
+
 
 const storyFileNames = fs.readdirSync(STORIES_DIR).filter(x => x.endsWith(".json"))
 const stories: Story[] = []
@@ -76,23 +132,37 @@ function getNextStory(): Story {
 
 
 
-export async function generateStory(): Promise<GeneratedStory> {
+export interface StoryScript {
+    story: GeneratedStory
+    outputDir: string
+    // TTS of lines already handed to Piper while the script was streaming in
+    started: Map<number, Promise<string>>
+}
+
+/**
+ * First stage of a story: its dialogue, loaded from disk if it was written
+ * before, otherwise written by the LLM and saved. A new script is parsed
+ * as it streams in and each line goes to TTS the moment it is complete.
+ */
+export async function generateStoryScript(): Promise<StoryScript> {
     const story = getNextStory();
     const outputDir = path.resolve(GENERATED_STORIES_DIR, story.id)
     const outputPath = path.resolve(outputDir, story.id + ".json")
     await ensureDirectory(path.dirname(outputPath))
     const outputExists = await checkFileExists(outputPath)
 
-    // If it already exists on disk, load it, generate missing audio, and return it
+    // If it already exists on disk, load it (missing audio is made in the next stage)
     if (outputExists) {
         const generatedStoryResult = await safe(readAndParseJson<GeneratedStory>(outputPath))
         if (generatedStoryResult.success) {
             console.log(`Story ${story.id} already exists on disk. Loading...`);
-            await generateStoryAudio({ story: generatedStoryResult.data, outputDir })
-            return generatedStoryResult.data
+            return { story: generatedStoryResult.data, outputDir, started: new Map() }
         }
     }
 
+    // WAVs left from an earlier script would be taken for the new lines
+    await removeWavs(outputDir)
+
     const userPrompt = `
 Here is the story to convert:
 **Title:** ${story.title}
@@ -106,12 +176,23 @@ Here is the story to convert:
 
     console.log(`Generating Script for: ${story.title}...\n`);
 
+    const started = new Map<number, Promise<string>>()
+    const parser = new DialogueStreamParser((line, index) => {
+        const audio = synthesizeLine(line, index, outputDir)
+        // Awaited by generateStoryAudio; only unhandled if the script fails
+        audio.catch(() => { })
+        started.set(index, audio)
+    })
+
     const result = await safe(askNvidiaAI({
         model: nvidiaModels.deepseek_v3_1,
         prompt: userPrompt,
         systemPrompt: STORY_SYSTEM_PROMPT,
         isThinking: false,
-        onToken: (token) => process.stdout.write(token)
+        onToken: (token) => {
+            process.stdout.write(token)
+            parser.push(token)
+        }
     }));
 
 
@@ -123,11 +204,10 @@ Here is the story to convert:
     const generatedStory: GeneratedStory = {
         original: story,
         content: result.data,
-        dialogue: parseDialogue(result.data)
+        dialogue: parser.end()
     }
 
     await fsp.writeFile(outputPath, JSON.stringify(generatedStory, null, 2))
-    await generateStoryAudio({ story: generatedStory, outputDir })
 
-    return generatedStory
+    return { story: generatedStory, outputDir, started }
 }
@@ -0,0 +1,206 @@
+import { EventEmitter } from "events";
+import { GeneratedStory } from "../common/types.js";
+import { STORY_AUDIO_CONCURRENCY, STORY_RETRY_DELAY_MS, STORY_SCRIPT_CONCURRENCY, STORY_WAIT_TIMEOUT_MS } from "../config/consts.js";
+import { createLimiter } from "../utils/limit.js";
+import { generateStoryAudio, generateStoryScript } from "./storyGenerator.js";
+
+/**
+ * A story whose script is written and whose lines get their audio one by
+ * one. Emits 'change' whenever a line is done or the story finishes/fails.
+ */
+export class StoryProgress extends EventEmitter {
+    readyLines = new Set<number>();
+    finished = false;
+    error: Error | null = null;
+    claimed = false; // handed to a streaming request instead of the buffer
+
+    constructor(public story: GeneratedStory) {
+        super();
+    }
+
+    /** A story that already has all of its audio */
+    static complete(story: GeneratedStory): StoryProgress {
+        const progress = new StoryProgress(story);
+        story.dialogue.forEach((_, index) => progress.readyLines.add(index));
+        progress.finished = true;
+        return progress;
+    }
+
+    lineReady(index: number) {
+        this.readyLines.add(index);
+        this.emit('change');
+    }
+
+    finish() {
+        this.finished = true;
+        this.emit('change');
+    }
+
+    fail(error: Error) {
+        this.error = error;
+        this.emit('change');
+    }
+
+    /**
+     * Calls `onLine` for every line in dialogue order, each as soon as it
+     * and the lines before it have audio. Resolves once the story is done,
+     * rejects if it fails.
+     */
+    forEachLine(onLine: (index: number) => void): Promise<void> {
+        return new Promise((resolve, reject) => {
+            let next = 0;
+            const flush = () => {
+                while (this.readyLines.has(next)) {
+                    onLine(next++);
+                }
+                if (this.error) {
+                    this.off('change', flush);
+                    reject(this.error);
+                } else if (this.finished) {
+                    this.off('change', flush);
+                    resolve();
+                }
+            };
+            this.on('change', flush);
+            flush();
+        });
+    }
+}
+
+/**
+ * Keeps `target` stories ready to serve. Each story goes through two
+ * stages with their own concurrency limits: the script (LLM) and its audio
+ * (TTS). A story moves on to TTS as soon as its script is done, so the
+ * next script is already being written while earlier stories are voiced.
+ * The buffer is topped up whenever a story is taken.
+ */
+export class StoryPipeline {
+    private ready: GeneratedStory[] = [];
+    private voicing: StoryProgress[] = []; // scripts done, audio under way, not claimed
+    private waiters: ((story: GeneratedStory) => void)[] = [];
+    private streamWaiters: ((progress: StoryProgress) => void)[] = [];
+    private inProgress = 0;
+    private retryTimer: NodeJS.Timeout | null = null;
+    private scriptStage = createLimiter(STORY_SCRIPT_CONCURRENCY);
+    private audioStage = createLimiter(STORY_AUDIO_CONCURRENCY);
+
+    constructor(private target: number) { }
+
+    /** Starts as many stories as the buffer (plus anyone waiting) is short of */
+    refill() {
+        if (this.retryTimer) {
+            return;
+        }
+        while (this.ready.length + this.inProgress < this.target + this.waiters.length + this.streamWaiters.length) {
+            this.inProgress++;
+            console.log("Refilling stories...");
+            this.produce();
+        }
+    }
+
+    private async produce() {
+        let progress: StoryProgress | null = null;
+        try {
+            const { story, outputDir, started } = await this.scriptStage(() => generateStoryScript());
+            const current = progress = new StoryProgress(story);
+            // Lines voiced while the script streamed in are ready without waiting for the audio stage
+            started.forEach((audio, index) => audio.then(() => current.lineReady(index), () => { }));
+            this.voicing.push(current);
+            const streamWaiter = this.streamWaiters.shift();
+            if (streamWaiter) {
+                streamWaiter(this.claim(current));
+            }
+
+            await this.audioStage(() => generateStoryAudio({ story, outputDir, started, onLine: (index) => current.lineReady(index) }));
+            current.finish();
+            if (!current.claimed) {
+                this.voicing.splice(this.voicing.indexOf(current), 1);
+                this.inProgress--;
+                this.deliver(story);
+            }
+        } catch (error) {
+            progress?.fail(error as Error);
+            if (!progress?.claimed) {
+                if (progress) {
+                    this.voicing.splice(this.voicing.indexOf(progress), 1);
+                }
+                this.inProgress--;
+            }
+            console.error("Error in background generation:", error);
+            // Back off instead of hammering a failing LLM / TTS
+            this.retryTimer ??= setTimeout(() => {
+                this.retryTimer = null;
+                this.refill();
+            }, STORY_RETRY_DELAY_MS);
+        }
+    }
+
+    /** Hands a story still being voiced to a stream; the buffer makes another */
+    private claim(progress: StoryProgress): StoryProgress {
+        progress.claimed = true;
+        this.voicing.splice(this.voicing.indexOf(progress), 1);
+        this.inProgress--;
+        this.refill();
+        return progress;
+    }
+
+    private deliver(story: GeneratedStory) {
+        const waiter = this.waiters.shift();
+        if (waiter) {
+            waiter(story);
+            return;
+        }
+        this.ready.push(story);
+        console.log(`Story generated. Cache size: ${this.ready.length}`);
+    }
+
+    private wait<T>(waiters: ((value: T) => void)[], timeoutMs: number): Promise<T | undefined> {
+        return new Promise((resolve) => {
+            const waiter = (value: T) => {
+                clearTimeout(timer);
+                resolve(value);
+            };
+            const timer = setTimeout(() => {
+                // Whatever was being made for this request goes to the buffer
+                waiters.splice(waiters.indexOf(waiter), 1);
+                resolve(undefined);
+            }, timeoutMs);
+            waiters.push(waiter);
+            this.refill();
+        });
+    }
+
+    /**
+     * Next ready story. With none ready it waits for the next one to come
+     * out of the pipeline, up to `timeoutMs` (then undefined).
+     */
+    take(timeoutMs = STORY_WAIT_TIMEOUT_MS): Promise<GeneratedStory | undefined> {
+        const story = this.ready.shift();
+        if (story) {
+            this.refill();
+            return Promise.resolve(story);
+        }
+
+        console.log("Cache empty! Waiting for the next story...");
+        return this.wait(this.waiters, timeoutMs);
+    }
+
+    /**
+     * Next story for a streaming request: a ready one, else the one furthest
+     * along in TTS, else the next one whose script is done (up to
+     * `timeoutMs`, then undefined). Its lines arrive through the progress.
+     */
+    takeProgressive(timeoutMs = STORY_WAIT_TIMEOUT_MS): Promise<StoryProgress | undefined> {
+        const story = this.ready.shift();
+        if (story) {
+            this.refill();
+            return Promise.resolve(StoryProgress.complete(story));
+        }
+        if (this.voicing.length > 0) {
+            return Promise.resolve(this.claim(this.voicing[0]));
+        }
+
+        console.log("Cache empty! Waiting for the next script...");
+        return this.wait(this.streamWaiters, timeoutMs);
+    }
+}
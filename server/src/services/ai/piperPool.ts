@@ -0,0 +1,139 @@
+import { spawn, ChildProcessWithoutNullStreams } from "node:child_process"
+import { createInterface } from "node:readline"
+import os from "node:os"
+import path from "node:path"
+import { PIPER_EXECUTABLE_PATH, PIPER_JOB_TIMEOUT_MS, PIPER_MODELS_PATH, PIPER_WORKERS_PER_MODEL } from "../../config/consts.js"
+import { PiperModel } from "../../common/types.js"
+
+interface PiperJob {
+    outputPath: string
+    resolve: () => void
+    reject: (error: Error) => void
+}
+
+/**
+ * One long-lived Piper process with its voice model loaded, fed sentences
+ * as `--json-input` lines. Piper handles them in order and prints each
+ * output path once its WAV is written: that path settles its job, and jobs
+ * queued ahead of it that Piper skipped fail. Other output is ignored. A
+ * worker that finishes nothing for PIPER_JOB_TIMEOUT_MS is killed.
+ */
+class PiperWorker {
+    private process: ChildProcessWithoutNullStreams
+    private inFlight: PiperJob[] = []
+    private stderrTail = ""
+    private watchdog: NodeJS.Timeout | null = null
+    alive = true
+
+    constructor(private model: PiperModel) {
+        const modelPath = path.resolve(PIPER_MODELS_PATH, `${model}.onnx`)
+        this.process = spawn(PIPER_EXECUTABLE_PATH, [
+            "--model",
+            modelPath,
+            "--json-input",
+            "--output_dir",
+            os.tmpdir(),
+        ])
+
+        createInterface({ input: this.process.stdout }).on("line", (line) => this.written(line.trim()))
+
+        // Piper logs every utterance; keep only enough to explain a crash
+        this.process.stderr.on("data", (chunk: Buffer) => {
+            this.stderrTail = (this.stderrTail + chunk.toString()).slice(-500)
+        })
+
+        this.process.on("error", (err) => {
+            this.fail(new Error(`Failed to spawn Piper: ${err.message}`))
+        })
+
+        this.process.on("close", (code) => {
+            this.fail(new Error(`Piper (${this.model}) exited with code ${code}: ${this.stderrTail.trim()}`))
+        })
+
+        // Writes to a worker that just died surface through 'close'
+        this.process.stdin.on("error", () => { })
+    }
+
+    get load(): number {
+        return this.inFlight.length
+    }
+
+    synthesize(text: string, outputPath: string): Promise<string> {
+        return new Promise((resolve, reject) => {
+            this.inFlight.push({ outputPath: path.resolve(outputPath), resolve: () => resolve(outputPath), reject })
+            if (this.inFlight.length === 1) {
+                this.arm()
+            }
+            this.process.stdin.write(JSON.stringify({ text, output_file: outputPath }) + "\n")
+        })
+    }
+
+    private written(line: string) {
+        const index = line ? this.inFlight.findIndex(job => job.outputPath === path.resolve(line)) : -1
+        if (index < 0) {
+            return
+        }
+        const settled = this.inFlight.splice(0, index + 1)
+        const job = settled.pop()!
+        for (const skipped of settled) {
+            skipped.reject(new Error(`Piper (${this.model}) skipped ${skipped.outputPath}: ${this.stderrTail.trim()}`))
+        }
+        job.resolve()
+        this.arm()
+    }
+
+    /** (Re)starts the hang timer for the job Piper is working on */
+    private arm() {
+        if (this.watchdog) {
+            clearTimeout(this.watchdog)
+            this.watchdog = null
+        }
+        if (this.inFlight.length === 0) {
+            return
+        }
+        this.watchdog = setTimeout(() => {
+            this.fail(new Error(`Piper (${this.model}) finished nothing in ${PIPER_JOB_TIMEOUT_MS} ms, killed it`))
+            this.process.kill("SIGKILL")
+        }, PIPER_JOB_TIMEOUT_MS)
+    }
+
+    private fail(error: Error) {
+        this.alive = false
+        for (const job of this.inFlight.splice(0)) {
+            job.reject(error)
+        }
+        this.arm()
+    }
+}
+
+/**
+ * Piper workers for every voice model, started on first use. Each model
+ * gets up to `size` processes; a sentence goes to the least busy one.
+ */
+class PiperPool {
+    private workers = new Map<PiperModel, PiperWorker[]>()
+
+    constructor(private size: number) { }
+
+    synthesize(model: PiperModel, text: string, outputPath: string): Promise<string> {
+        return this.pick(model).synthesize(text, outputPath)
+    }
+
+    private pick(model: PiperModel): PiperWorker {
+        const workers = (this.workers.get(model) ?? []).filter(worker => worker.alive)
+        this.workers.set(model, workers)
+
+        const idle = workers.find(worker => worker.load === 0)
+        if (idle) {
+            return idle
+        }
+        if (workers.length < this.size) {
+            const worker = new PiperWorker(model)
+            workers.push(worker)
+            return worker
+        }
+        return workers.reduce((a, b) => (b.load < a.load ? b : a))
+    }
+}
+
+export const piperPool = new PiperPool(PIPER_WORKERS_PER_MODEL)
@@ -1,14 +1,14 @@
-import { spawn } from "node:child_process"
 import path from "node:path"
-import { ensureDirectory } from "../../utils/index.js"
-import { PIPER_EXECUTABLE_PATH, PIPER_MODELS_PATH } from "../../config/consts.js"
+import { checkFileExists, ensureDirectory } from "../../utils/index.js"
 import { PiperModel } from "../../common/types.js"
+import { piperPool } from "./piperPool.js"
+import { ttsCache, linkOrCopy } from "./ttsCache.js"
 
 /**
  * Cleans text to make it suitable for Piper TTS.
  * Removes URLs, Markdown, Emojis, and special characters that sound bad.
  */
-function cleanTextForTts(text: string): string {
+export function cleanTextForTts(text: string): string {
     return text
         // 1. Remove URLs (http/https)
         .replace(/(?:https?|ftp):\/\/[\n\S]+/g, '')
@@ -40,7 +40,9 @@ function cleanTextForTts(text: string): string {
 }
 
 /**
- * Generates audio from text using local Piper TTS.
+ * Generates audio from text using local Piper TTS (a pooled, already
+ * loaded Piper process per voice; see piperPool.ts). Lines already in the
+ * TTS cache (same cleaned text and voice) are linked in, not synthesized.
  */
 export async function ttsPiper(
     { text,
@@ -60,32 +62,19 @@ export async function ttsPiper(
         throw new Error("Text is empty after cleaning.");
     }
 
-    console.log(`Generating tts: ${cleanedText}`)
     await ensureDirectory(path.dirname(outputPath))
 
-    return new Promise((resolve, reject) => {
-        const modelPath = path.resolve(PIPER_MODELS_PATH, `${model}.onnx`)
-        const piperProcess = spawn(PIPER_EXECUTABLE_PATH, [
-            "--model",
-            modelPath,
-            "--output_file",
-            outputPath,
-        ])
-
-        piperProcess.on("error", (err) => {
-            reject(new Error(`Failed to spawn Piper: ${err.message}`))
-        })
-
-        piperProcess.on("close", (code) => {
-            if (code === 0) {
-                resolve(outputPath)
-            } else {
-                reject(new Error(`Piper process exited with code ${code}`))
-            }
-        })
+    // A WAV already at outputPath is this line's (a story's WAVs are cleared
+    // whenever its dialogue is regenerated), so it only seeds the cache
+    if (!(await ttsCache.has(model, cleanedText)) && await checkFileExists(outputPath)) {
+        await ttsCache.put(model, cleanedText, outputPath)
+        return outputPath
+    }
 
-        // SEND THE CLEANED TEXT
-        piperProcess.stdin.write(cleanedText)
-        piperProcess.stdin.end()
+    const cachedPath = await ttsCache.get(model, cleanedText, (partialPath) => {
+        console.log(`Generating tts: ${cleanedText}`)
+        return piperPool.synthesize(model, cleanedText, partialPath)
     })
-}
\ No newline at end of file
+    await linkOrCopy(cachedPath, outputPath)
+    return outputPath
+}
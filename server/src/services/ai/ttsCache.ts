@@ -0,0 +1,148 @@
+import { createHash } from "node:crypto"
+import path from "node:path"
+import fsp from "node:fs/promises"
+import { checkFileExists, ensureDirectory } from "../../utils/index.js"
+import { TTS_CACHE_DIR, TTS_CACHE_MAX_MB } from "../../config/consts.js"
+import { PiperModel } from "../../common/types.js"
+
+/**
+ * Makes `dest` a copy of `src`: a hard link where possible, a copy with the
+ * same mtime otherwise. Skipped when `dest` already matches, so served
+ * files keep their ETag across reloads.
+ */
+export async function linkOrCopy(src: string, dest: string): Promise<void> {
+    const [srcStat, destStat] = await Promise.all([fsp.stat(src), fsp.stat(dest).catch(() => null)])
+    if (destStat && destStat.size === srcStat.size && destStat.mtimeMs === srcStat.mtimeMs) {
+        return
+    }
+    const partialPath = `${dest}.partial`
+    await fsp.rm(partialPath, { force: true })
+    try {
+        await fsp.link(src, partialPath)
+    } catch {
+        await fsp.copyFile(src, partialPath)
+        await fsp.utimes(partialPath, srcStat.atime, srcStat.mtime)
+    }
+    await fsp.rename(partialPath, dest)
+}
+
+/**
+ * Synthesized lines shared by every story, stored as `<sha256>.wav` where
+ * the hash covers the voice model and the cleaned text. Least recently
+ * used entries are evicted once the cache holds more than `maxBytes`.
+ */
+export class TtsCache {
+    // key -> size in bytes, least recently used first
+    private entries = new Map<string, number>()
+    private totalBytes = 0
+    private ready: Promise<void> | null = null
+    private inFlight = new Map<string, Promise<string>>()
+
+    constructor(private dir: string, private maxBytes: number) { }
+
+    static key(model: PiperModel, text: string): string {
+        return createHash('sha256').update(`${model}\n${text}`).digest('hex')
+    }
+
+    private pathFor(key: string): string {
+        return path.resolve(this.dir, `${key}.wav`)
+    }
+
+    private load(): Promise<void> {
+        this.ready ??= (async () => {
+            await ensureDirectory(this.dir)
+            const found: { key: string; size: number; atimeMs: number }[] = []
+            for (const name of await fsp.readdir(this.dir)) {
+                const file = path.resolve(this.dir, name)
+                // Leftovers of syntheses interrupted by a crash
+                if (!name.endsWith('.wav')) {
+                    await fsp.rm(file, { force: true })
+                    continue
+                }
+                const fileStat = await fsp.stat(file)
+                found.push({ key: name.slice(0, -'.wav'.length), size: fileStat.size, atimeMs: fileStat.atimeMs })
+            }
+            found.sort((a, b) => a.atimeMs - b.atimeMs)
+            for (const entry of found) {
+                this.add(entry.key, entry.size)
+            }
+            console.log(`TTS cache: ${found.length} lines, ${Math.round(this.totalBytes / (1024 * 1024))} MB`)
+            await this.evict()
+        })()
+        return this.ready
+    }
+
+    private add(key: string, size: number) {
+        this.totalBytes += size - (this.entries.get(key) ?? 0)
+        this.entries.delete(key)
+        this.entries.set(key, size)
+    }
+
+    private touch(key: string) {
+        const size = this.entries.get(key)!
+        this.entries.delete(key)
+        this.entries.set(key, size)
+    }
+
+    private async evict() {
+        for (const [key, size] of this.entries) {
+            if (this.totalBytes <= this.maxBytes) {
+                break
+            }
+            this.entries.delete(key)
+            this.totalBytes -= size
+            // Story folders keep their own links to the file
+            await fsp.rm(this.pathFor(key), { force: true })
+        }
+    }
+
+    async has(model: PiperModel, text: string): Promise<boolean> {
+        await this.load()
+        return this.entries.has(TtsCache.key(model, text))
+    }
+
+    /**
+     * Path of the cached WAV for a line. On a miss `synthesize` is called
+     * to write it to the path it is given; concurrent requests for the same
+     * line share one synthesis.
+     */
+    async get(model: PiperModel, text: string, synthesize: (outputPath: string) => Promise<unknown>): Promise<string> {
+        await this.load()
+        const key = TtsCache.key(model, text)
+        if (this.entries.has(key)) {
+            if (await checkFileExists(this.pathFor(key))) {
+                this.touch(key)
+                return this.pathFor(key)
+            }
+            // Deleted behind our back: synthesize it again
+            this.totalBytes -= this.entries.get(key)!
+            this.entries.delete(key)
+        }
+
+        let pending = this.inFlight.get(key)
+        if (!pending) {
+            pending = (async () => {
+                const file = this.pathFor(key)
+                const partialPath = `${file}.partial`
+                await synthesize(partialPath)
+                await fsp.rename(partialPath, file)
+                this.add(key, (await fsp.stat(file)).size)
+                await this.evict()
+                return file
+            })().finally(() => this.inFlight.delete(key))
+            this.inFlight.set(key, pending)
+        }
+        return pending
+    }
+
+    /** Adds an existing WAV of a line to the cache. */
+    async put(model: PiperModel, text: string, wavPath: string): Promise<void> {
+        await this.load()
+        const key = TtsCache.key(model, text)
+        await linkOrCopy(wavPath, this.pathFor(key))
+        this.add(key, (await fsp.stat(wavPath)).size)
+        await this.evict()
+    }
+}
+
+export const ttsCache = new TtsCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 1024 * 1024)
@@ -1,5 +1,5 @@
-import fsp, { readFile, mkdir, stat, readdir, constants } from "node:fs/promises";
-import { extname } from 'node:path';
+import fsp, { readFile, mkdir, stat, readdir, rm, constants } from "node:fs/promises";
+import { extname, resolve } from 'node:path';
 
 export async function readAndParseJson<T>(filePath: string): Promise<T> {
     try {
@@ -45,12 +45,13 @@ export async function ensureDirectory(dirPath: string): Promise<string> {
 }
 
 
-export async function getWavCount(dirPath: string): Promise<number> {
+export async function removeWavs(dirPath: string): Promise<void> {
     const entries = await readdir(dirPath, { withFileTypes: true });
 
-    return entries.filter((entry) =>
-        entry.isFile() && extname(entry.name).toLowerCase() === '.wav'
-    ).length;
+    await Promise.all(entries
+        .filter((entry) => entry.isFile() && extname(entry.name).toLowerCase() === '.wav')
+        .map((entry) => rm(resolve(dirPath, entry.name), { force: true }))
+    );
 }
 
 
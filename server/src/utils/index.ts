@@ -1,3 +1,4 @@
 export * from './safe.js';
 export * from './filesystem.js';
+export * from './limit.js';
 export * from '../lib/storyGenerator.js'
\ No newline at end of file
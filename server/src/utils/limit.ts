@@ -0,0 +1,30 @@
+/**
+ * Returns a function that runs the tasks handed to it, at most
+ * `concurrency` at a time; the rest wait their turn in order.
+ */
+export function createLimiter(concurrency: number) {
+    let active = 0
+    const queue: (() => void)[] = []
+
+    const next = () => {
+        if (active < concurrency && queue.length > 0) {
+            active++
+            queue.shift()!()
+        }
+    }
+
+    return function limit<T>(task: () => Promise<T>): Promise<T> {
+        return new Promise<T>((resolve, reject) => {
+            queue.push(() => {
+                Promise.resolve()
+                    .then(task)
+                    .then(resolve, reject)
+                    .finally(() => {
+                        active--
+                        next()
+                    })
+            })
+            next()
+        })
+    }
+}